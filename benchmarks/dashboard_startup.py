@@ -0,0 +1,45 @@
+import calendar
+import os
+import pickle
+import sys
+import timeit
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'streamlit'))
+
+from dashboard_data import build_dataset  # noqa: E402
+
+DATA_DIR = 'streamlit/data'
+CSV_FILES = ['palm_oil.csv', 'historical_climate_v4.csv', 'ssp126_climate4.csv']
+# st.cache_data hands back an unpickled copy of each frame on every call
+CACHED = {name: pickle.dumps(pd.read_csv(f'{DATA_DIR}/{name}')) for name in CSV_FILES}
+
+
+def legacy_load():
+    # what Dashboard.py used to do at import time on every rerun
+    palm_oil = pickle.loads(CACHED['palm_oil.csv'])
+    palm_oil['Month_Name'] = palm_oil['Month'].apply(lambda x: calendar.month_abbr[x])
+    climate_info = pd.concat([
+        pickle.loads(CACHED['historical_climate_v4.csv']),
+        pickle.loads(CACHED['ssp126_climate4.csv']),
+    ], ignore_index=True)
+    climate_info['Month_Name'] = climate_info['Month'].apply(lambda x: calendar.month_abbr[x])
+    climate_info = climate_info[climate_info['Year'] >= climate_info['Year'].max() - 9]
+    return palm_oil, climate_info, list(palm_oil['Year'].unique())
+
+
+def main(number=20):
+    dataset = build_dataset()
+    results = {
+        'legacy load per rerun': lambda: legacy_load(),
+        'dataset build (cold start)': lambda: build_dataset(),
+        'dataset access (warm rerun)': lambda: (dataset.palm_oil, dataset.climate_info, dataset.years),
+    }
+    for name, func in results.items():
+        seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print(f'{name:<30} {seconds * 1000:8.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
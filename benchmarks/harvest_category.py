@@ -0,0 +1,67 @@
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'streamlit'))
+
+from dashboard_data import CATEGORY_COLUMNS, YIELD_COLUMNS, harvest_category, harvest_codes  # noqa: E402
+
+DATA_DIR = 'streamlit/data'
+
+
+def legacy_category(value, avg_value, highest_value):
+    if value < avg_value:
+        return 'Below Average'
+    elif value == highest_value:
+        return 'Peak Harvest'
+    else:
+        return 'Above Average'
+
+
+def legacy_year(this_year):
+    # the Series.apply path process_data used to run three times per rerun
+    this_year = this_year.copy()
+    for column, category in zip(YIELD_COLUMNS, CATEGORY_COLUMNS):
+        this_year[category] = this_year[column].apply(legacy_category, args=(this_year[column].mean(), this_year[column].max()))
+    return this_year
+
+
+def vectorized_year(this_year):
+    this_year = this_year.copy()
+    for column, category in zip(YIELD_COLUMNS, CATEGORY_COLUMNS):
+        this_year[category] = harvest_category(this_year[column], this_year[column].mean(), this_year[column].max())
+    return this_year
+
+
+def vectorized_all_years(palm_oil, stats):
+    # every year and every metric in a single harvest_codes call
+    mean, highest = stats
+    return harvest_codes(palm_oil[YIELD_COLUMNS].to_numpy(), mean, highest)
+
+
+def main(number=200):
+    palm_oil = pd.read_csv(f'{DATA_DIR}/palm_oil.csv')
+    this_year = palm_oil[palm_oil['Year'] == 2023]
+    grouped = palm_oil.groupby('Year')[YIELD_COLUMNS]
+    stats = (grouped.transform('mean').to_numpy(), grouped.transform('max').to_numpy())
+
+    expected = legacy_year(this_year)[CATEGORY_COLUMNS].astype(str)
+    assert np.array_equal(vectorized_year(this_year)[CATEGORY_COLUMNS].astype(str).to_numpy(), expected.to_numpy())
+
+    results = {
+        'apply, one year': lambda: legacy_year(this_year),
+        'vectorized, one year': lambda: vectorized_year(this_year),
+        'apply, all years': lambda: [legacy_year(g) for _, g in palm_oil.groupby('Year')],
+        'vectorized, all years': lambda: vectorized_all_years(palm_oil, stats),
+    }
+    for name, func in results.items():
+        n = max(number // 20, 1) if 'apply, all' in name else number
+        seconds = min(timeit.repeat(func, number=n, repeat=3)) / n
+        print(f'{name:<25} {seconds * 1000:8.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'streamlit'))
+
+import inference_service  # noqa: E402
+from projection import FEATURES, load_models, load_scenarios  # noqa: E402
+
+ADDRESS = f'{inference_service.RUNTIME_DIR}/palm_yield_inference_bench.sock'
+
+
+def sessions(model, row, threads, requests):
+    # `threads` sessions each asking for `requests` single-row predictions
+    def session():
+        for _ in range(requests):
+            model.predict(row)
+
+    workers = [threading.Thread(target=session) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * requests / (time.perf_counter() - start)
+
+
+def main(workers, threads=(1, 4, 16, 64), requests=25):
+    X = load_scenarios()['SSP585'][FEATURES]
+    row = X.iloc[:1]
+    local = load_models()['FFB_Yield']
+
+    server = subprocess.Popen(
+        [sys.executable, 'streamlit/inference_service.py', '--address', ADDRESS, '--workers', str(workers)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        # wait until the workers are up and the service answers
+        for _ in range(300):
+            try:
+                inference_service.get_client(ADDRESS).served()
+                break
+            except OSError:
+                time.sleep(0.1)
+        remote = inference_service.load_models(address=ADDRESS)['FFB_Yield']
+        assert np.array_equal(local.predict(X), remote.predict(X))
+
+        print(f'{os.cpu_count()} cores, {workers} service workers, single-row requests/s')
+        print(f"{'sessions':>8} {'in-process':>11} {'service':>9}")
+        for n in threads:
+            print(f'{n:>8} {sessions(local, row, n, requests):>11,.0f} {sessions(remote, row, n, requests):>9,.0f}')
+        stats = inference_service.get_client(ADDRESS).stats()
+        print(f"{stats['requests']:,} requests served in {stats['batches']:,} batches")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Single-row prediction throughput, in-process vs the inference service.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='service worker processes (default: all cores)')
+    args = parser.parse_args()
+    main(args.workers)
@@ -0,0 +1,55 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'streamlit'))
+
+from dashboard_data import build_dataset  # noqa: E402
+from insight_payload import build_payload, estimate_tokens  # noqa: E402
+from insight_service import payload_key  # noqa: E402
+
+
+def legacy_payload(metrics, yearly_yield, this_year, climate_info):
+    # the str()-of-DataFrames payload collect_dashboard_data used to send
+    key_metrics = {
+        'FFB Yield': {'Latest Year': metrics['latest_ffb'], 'Previous Year': metrics['prev_ffb'], 'Change (%)': metrics['ffb_change_pct']},
+        'CPO Yield': {'Latest Year': metrics['latest_cpo'], 'Previous Year': metrics['prev_cpo'], 'Change (%)': metrics['cpo_change_pct']},
+        'FFB Production': {'Latest Year': metrics['latest_prod'], 'Previous Year': metrics['prev_prod'], 'Change (%)': metrics['prod_change_pct']},
+    }
+    trends = {
+        'FFB Yield': yearly_yield[['Year', 'FFB_Yield']],
+        'CPO Yield': yearly_yield[['Year', 'CPO_Yield']],
+        'FFB Production': yearly_yield[['Year', 'FFB_production']],
+    }
+    monthly = {
+        'FFB': this_year[['Month_Name', 'FFB_Yield', 'FFB_Yield_Category']],
+        'CPO': this_year[['Month_Name', 'CPO_Yield', 'CPO_Yield_Category']],
+        'FFB Production': this_year[['Month_Name', 'FFB_production', 'FFB_Production_Category']],
+    }
+    climate_data = {
+        label: climate_info[['Year', 'Month_Name', column]]
+        for label, column in [('Precipitation', 'pr'), ('Temperature', 'tas'), ('Humidity', 'hurs'),
+                              ('Max Temperature', 'tasmax'), ('Min Temperature', 'tasmin'),
+                              ('Cumalative Wet Days', 'cwd'), ('Cumalative Dry Days', 'cdd'), ('Summer Days', 'sd')]
+    }
+    return {'key_metrics': str(key_metrics), 'trends': str(trends), 'monthly': str(monthly), 'climate': str(climate_data)}
+
+
+def main(number=50, year=2023):
+    dataset = build_dataset()
+    index = dataset.index
+    args = (index.metrics(year), index.yearly_yield(year), index.this_year(year), dataset.climate_info)
+
+    # rebuilding from the same state must give the same cache key
+    assert payload_key(build_payload(*args)) == payload_key(build_payload(*args))
+
+    for name, func in [('legacy str()', legacy_payload), ('compact json', build_payload)]:
+        payload = func(*args)
+        size = sum(len(text) for text in payload.values())
+        tokens = sum(estimate_tokens(text) for text in payload.values())
+        seconds = min(timeit.repeat(lambda: func(*args), number=number, repeat=3)) / number
+        print(f'{name:<15} {size:7d} chars  ~{tokens:5d} tokens  {seconds * 1000:7.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
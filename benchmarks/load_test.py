@@ -0,0 +1,174 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'streamlit'))
+# JamAI is replaced by the offline backend before any page imports it
+os.environ.setdefault('DASHBOARD_INSIGHT_BACKEND', 'stub')
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import model_registry  # noqa: E402
+import tree_backend  # noqa: E402
+from insight_service import get_insight_service  # noqa: E402
+
+PAGES = ['Dashboard.py', 'PredictionTool.py']
+PERCENTILES = (50, 95, 99)
+
+
+def _slider(at, label):
+    return next(slider for slider in at.slider if slider.label == label)
+
+
+def dashboard_action(at, rng):
+    # pick a year, sometimes ask for the AI summary
+    slider = at.slider[0]
+    slider.set_value(rng.randint(slider.min, slider.max))
+    if rng.random() < 0.2:
+        at.run()
+        at.button[0].click()
+
+
+def prediction_tool_action(at, rng):
+    action = rng.choice(['ssp', 'year', 'month', 'manual'])
+    if action == 'ssp':
+        ssp = at.segmented_control[0]
+        ssp.set_value(rng.choice(ssp.options))
+    elif action == 'year':
+        _slider(at, 'Select Year').set_value(rng.randint(2025, 2100))
+    elif action == 'month':
+        _slider(at, 'Select Month').set_value(rng.randint(1, 12))
+    else:
+        _slider(at, 'Precipitation (mm)').set_value(round(rng.uniform(0, 500), 1))
+
+
+ACTIONS = {'Dashboard.py': dashboard_action, 'PredictionTool.py': prediction_tool_action}
+
+
+def session(page, steps, seed, results, timeout):
+    # one simulated user: a cold first run, then `steps` widget changes
+    rng = random.Random(seed)
+    at = AppTest.from_file(os.path.join(ROOT, 'streamlit', page), default_timeout=timeout)
+    at.secrets['jamAIbase'] = {'project_id': 'stub', 'pat': 'stub'}
+    record = results[page]
+    for step in range(steps + 1):
+        if step:
+            ACTIONS[page](at, rng)
+        start = time.perf_counter()
+        at.run()
+        seconds = time.perf_counter() - start
+        with record['lock']:
+            record['first' if step == 0 else 'reruns'].append(seconds)
+            record['errors'] += len(at.exception)
+
+
+def _summary(seconds):
+    if not seconds:
+        return {}
+    ms = np.asarray(seconds) * 1000
+    out = {f'p{p}_ms': round(float(np.percentile(ms, p)), 2) for p in PERCENTILES}
+    out['max_ms'] = round(float(ms.max()), 2)
+    return out
+
+
+def _peak_rss_mb(pid='self'):
+    # VmHWM is the process's peak resident set; Linux only
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _child_pids():
+    # live child processes, e.g. the loky workers behind the Compare Scenarios tab
+    pids = []
+    for pid in filter(str.isdigit, os.listdir('/proc') if os.path.isdir('/proc') else []):
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == os.getpid():
+                    pids.append(pid)
+        except (OSError, IndexError, ValueError):
+            pass
+    return pids
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(sessions=8, steps=20, seed=0, pages=PAGES, timeout=300):
+    results = {page: {'first': [], 'reruns': [], 'errors': 0, 'lock': threading.Lock()} for page in pages}
+    # sessions are spread over the pages and run concurrently, like users of one server
+    threads = [
+        threading.Thread(target=session, args=(pages[i % len(pages)], steps, seed + i, results, timeout))
+        for i in range(sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'commit': _commit(),
+        'sessions': sessions,
+        'steps': steps,
+        'seed': seed,
+        'wall_s': round(time.perf_counter() - start, 2),
+        'pages': {
+            page: {
+                'runs': len(record['first']) + len(record['reruns']),
+                'errors': record['errors'],
+                'first_run': _summary(record['first']),
+                'rerun': _summary(record['reruns']),
+            }
+            for page, record in results.items()
+        },
+        'peak_rss_mb': {
+            'main': _peak_rss_mb() or round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'workers': {pid: _peak_rss_mb(pid) for pid in _child_pids()},
+        },
+        # this process only; scenario_runner's worker processes load their own copies
+        'model_loads': model_registry.registry.loads,
+        'compiled_models': len(tree_backend._compiled),
+        'insights': get_insight_service().stats(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive the Streamlit pages headlessly and report rerun latency.')
+    parser.add_argument('--sessions', type=int, default=8, help='concurrent simulated users')
+    parser.add_argument('--steps', type=int, default=20, help='widget changes per session')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pages', nargs='+', default=PAGES, choices=PAGES)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    # pages resolve their data paths relative to the repository root
+    os.chdir(ROOT)
+    # the pages print progress banners; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run(args.sessions, args.steps, args.seed, args.pages)
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'streamlit'))
+
+from features import FEATURES  # noqa: E402
+from model_registry import load_model  # noqa: E402
+from tree_backend import CompiledForest  # noqa: E402
+
+MODEL_PATH = 'streamlit/ffb_yield_model5.pkl'
+DATA_DIR = 'streamlit/data'
+
+
+def throughput(predict, X):
+    start = time.perf_counter()
+    predict(X)
+    return len(X) / (time.perf_counter() - start)
+
+
+def main(rows=100_000, number=200):
+    model = load_model(MODEL_PATH)
+    start = time.perf_counter()
+    compiled = CompiledForest(model)
+    print(f'compile                  {(time.perf_counter() - start) * 1000:8.1f} ms')
+
+    climate = pd.read_csv(f'{DATA_DIR}/ssp585_climate4.csv')[FEATURES]
+    X = climate.sample(rows, replace=True, random_state=0).reset_index(drop=True)
+    assert np.array_equal(model.predict(X), compiled.predict(X))
+
+    row = X.iloc[:1]
+    for name, predict in [('sklearn', model.predict), ('compiled', compiled.predict)]:
+        latency = min(timeit.repeat(lambda: predict(row), number=number, repeat=3)) / number
+        print(f'{name:<9} single row     {latency * 1000:8.3f} ms')
+        print(f'{name:<9} {rows:,} rows  {throughput(predict, X):10,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,112 +7,22 @@ import matplotlib.pyplot as plt # type: ignore
 from datetime import datetime, timedelta
 import calendar
 from millify import millify # type: ignore
-from jamaibase import JamAI, protocol as p # type: ignore
-
-
-# load the data
-@st.cache_data
-def load_data(path):
-    return pd.read_csv(path)
-
-def get_month_name(data):
-    data['Month_Name'] = data['Month'].apply(lambda x: calendar.month_abbr[x])
-    return data
-
-def filter_data_by_year(palm_oil, selected_year):
-    return palm_oil[palm_oil['Year'] <= selected_year]
-
-def calculate_yearly_yield(palm_oil):
-    return palm_oil.groupby('Year').sum().reset_index()
-
-def harvest_category(value, avg_value, highest_value):
-    if value < avg_value:
-        return 'Below Average'
-    elif value == highest_value:
-        return 'Peak Harvest'
-    else:
-        return 'Above Average'
-      
-palm_oil = load_data("streamlit/data/palm_oil.csv")
-palm_oil = get_month_name(palm_oil)
-
-climate_info = load_data('streamlit/data/historical_climate_v4.csv')
-climate_2 = load_data('streamlit/data/ssp126_climate4.csv')
-
-climate_info = pd.concat([climate_info, climate_2], ignore_index=True)
-climate_info = get_month_name(climate_info)
-selected_year = max(climate_info['Year'])
-earliest_year = selected_year - 9
-climate_info = climate_info[climate_info['Year'] >= earliest_year]
-
-years = list(palm_oil['Year'].unique())
+from chart_cache import cached_altair_chart, fingerprint
+from dashboard_data import get_dataset
+from insight_payload import build_payload
+from insight_service import get_insight_service
+from instrumentation import rerun, timer
 
 
+@timer('process_data')
 def process_data(selected_years):
-    # filter data based on selected years
-    palm_oil_filtered = filter_data_by_year(palm_oil, selected_years)
-    climate_info_filtered = filter_data_by_year(climate_info, selected_years)
-
-    yearly_yield = calculate_yearly_yield(palm_oil_filtered)
-    latest_year = yearly_yield['Year'].max()
-    earliest_year = max(latest_year - 9, yearly_yield['Year'].min())
-    prev_year = latest_year - 1
-    yearly_yield = yearly_yield[yearly_yield['Year'] >= earliest_year]
-    yearly_yield['Year'] = yearly_yield['Year'].astype(int)
-
-    monthly_yield = palm_oil_filtered[palm_oil_filtered['Year'] >= prev_year].reset_index(drop=True)
-    climate_info_filtered = climate_info_filtered[climate_info_filtered['Year'] >= earliest_year].reset_index(drop=True)
-
-    # Metrics
-    latest_ffb = yearly_yield[yearly_yield['Year'] == latest_year]['FFB_Yield'].values[0]
-    prev_ffb = yearly_yield[yearly_yield['Year'] == prev_year]['FFB_Yield'].values[0]
-    ffb_change_pct = ((latest_ffb - prev_ffb) / prev_ffb) * 100
-
-    latest_cpo = yearly_yield[yearly_yield['Year'] == latest_year]['CPO_Yield'].values[0]
-    prev_cpo = yearly_yield[yearly_yield['Year'] == prev_year]['CPO_Yield'].values[0]
-    cpo_change_pct = ((latest_cpo - prev_cpo) / prev_cpo) * 100
-
-    latest_prod = yearly_yield[yearly_yield['Year'] == latest_year]['FFB_production'].values[0]
-    prev_prod = yearly_yield[yearly_yield['Year'] == prev_year]['FFB_production'].values[0]
-    prod_change_pct = ((latest_prod - prev_prod) / prev_prod) * 100
-
-    this_year = monthly_yield[monthly_yield['Year'] == latest_year]
-
-    # Calculate highest monthly yield
-    highest_monthly_ffb = this_year['FFB_Yield'].max()
-    highest_monthly_cpo = this_year['CPO_Yield'].max()
-    highest_monthly_prod = this_year['FFB_production'].max()
-
-    # Calculate average monthly yield
-    avg_monthly_ffb = this_year['FFB_Yield'].mean()
-    avg_monthly_cpo = this_year['CPO_Yield'].mean()
-    avg_monthly_prod = this_year['FFB_production'].mean()
-
-    # add harvest category column
-    this_year['FFB_Yield_Category'] = this_year['FFB_Yield'].apply(harvest_category, args=(avg_monthly_ffb, highest_monthly_ffb))
-    this_year['CPO_Yield_Category'] = this_year['CPO_Yield'].apply(harvest_category, args=(avg_monthly_cpo, highest_monthly_cpo))
-    this_year['FFB_Production_Category'] = this_year['FFB_production'].apply(harvest_category, args=(avg_monthly_prod, highest_monthly_prod))
-
-    return {
-        'yearly_yield': yearly_yield,
-        'monthly_yield': monthly_yield,
-        'this_year': this_year,
-        'latest_year': latest_year,
-        'prev_year': prev_year,
-        'latest_ffb': latest_ffb,
-        'prev_ffb': prev_ffb,
-        'ffb_change_pct': ffb_change_pct,
-        'latest_cpo': latest_cpo,
-        'prev_cpo': prev_cpo,
-        'cpo_change_pct': cpo_change_pct,
-        'latest_prod': latest_prod,
-        'prev_prod': prev_prod,
-        'prod_change_pct': prod_change_pct,
-        'avg_monthly_ffb': avg_monthly_ffb,
-        'avg_monthly_cpo': avg_monthly_cpo,
-        'avg_monthly_prod': avg_monthly_prod
-    }
-
+    # every value comes precomputed from the yearly index
+    index = get_dataset().index
+    data = index.metrics(selected_years)
+    data['yearly_yield'] = index.yearly_yield(selected_years)
+    data['monthly_yield'] = index.monthly_yield(selected_years)
+    data['this_year'] = index.this_year(selected_years)
+    return data
 
 
 color_palette = ["#fd8d3c", "#a1d99b", "#ffffcc"]
@@ -194,6 +104,20 @@ def month_comparison(monthly_yield, var):
     
     return lines
 
+def production_comparison(monthly_yield):
+    lines = alt.Chart(monthly_yield).mark_line(point=True).encode(
+                x=alt.X('Month_Name:N', title='', axis=alt.Axis(labelAngle=0), sort=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']),
+                tooltip=[alt.Tooltip('FFB_production:Q', format='.2s')],
+                y=alt.Y('FFB_production:Q', title='FFB production (tonnes)', axis=alt.Axis(format='.2s')),
+                color=alt.Color('Year:N', title='Year', scale=alt.Scale(range=color_palette), legend=alt.Legend(title='', orient='top')),
+                detail='Year:N'
+            ).properties(
+                width=600,
+                height=300
+            )
+
+    return lines
+
 # print(monthly_yield)
 # print(this_year)
 # Malaysia Palm Oil Yield Dashboard
@@ -202,6 +126,9 @@ def page1():
     print('\n\n')
     print('---------------------------------------------Runing page Dashboard---------------------------------------------')
     st.title("Palm Oil Yield Dashboard 📊")
+    dataset = get_dataset()
+    years = dataset.years
+    climate_info = dataset.climate_info
     col1, col2 = st.columns((4.8,5), gap='medium')
     with col1:
         st.write("")
@@ -279,152 +206,68 @@ def page1():
         with ffb:
             # Monthly Yield
             st.subheader("Monthly  FFB Yield")
-            chart = month_bar(this_year, 'FFB_Yield', 'FFB_Yield_Category')
-            st.altair_chart(chart, use_container_width=True)
+            cached_altair_chart('month_bar', 'FFB_Yield', this_year, lambda: month_bar(this_year, 'FFB_Yield', 'FFB_Yield_Category'))
             
             # compare the monthly yield for the latest year with prev year
             st.subheader("Monthly FFB Yield Comparison")
-            lines = month_comparison(monthly_yield, 'FFB')
-            st.altair_chart(lines, use_container_width=True)
+            cached_altair_chart('month_comparison', 'FFB', monthly_yield, lambda: month_comparison(monthly_yield, 'FFB'))
         
             # past years trend
             st.subheader(f"FFB Yield {len(yearly_yield)} years trend")
-            chart = trend_10(yearly_yield, 'FFB_Yield')
-            st.altair_chart(chart, use_container_width=True)
+            cached_altair_chart('trend_10', 'FFB_Yield', yearly_yield, lambda: trend_10(yearly_yield, 'FFB_Yield'))
             
             
         with cpo:
             
             # Monthly Yield
             st.subheader("Monthly CPO Yield")
-            cpo_yield_chart = month_bar(this_year, 'CPO_Yield', 'CPO_Yield_Category')
-            st.altair_chart(cpo_yield_chart, use_container_width=True)
+            cached_altair_chart('month_bar', 'CPO_Yield', this_year, lambda: month_bar(this_year, 'CPO_Yield', 'CPO_Yield_Category'))
             
             # compare the monthly yield for the latest year with prev year
             st.subheader("Monthly CPO Yield Comparison")
-            lines = month_comparison(monthly_yield, 'CPO')
-            st.altair_chart(lines, use_container_width=True)
+            cached_altair_chart('month_comparison', 'CPO', monthly_yield, lambda: month_comparison(monthly_yield, 'CPO'))
             
             # past years trend
             st.subheader("CPO Yield 10 years trend")
-            chart = trend_10(yearly_yield, 'CPO_Yield')
-            st.altair_chart(chart, use_container_width=True)
+            cached_altair_chart('trend_10', 'CPO_Yield', yearly_yield, lambda: trend_10(yearly_yield, 'CPO_Yield'))
             
         with prod:
             
             # Monthly Yield
             st.subheader("Monthly FFB Production")
-            ffb_production_chart = month_bar(this_year, 'FFB_production', 'FFB_Production_Category', millify_values=True)
-            st.altair_chart(ffb_production_chart, use_container_width=True)
+            cached_altair_chart('month_bar', 'FFB_production', this_year, lambda: month_bar(this_year, 'FFB_production', 'FFB_Production_Category', millify_values=True))
             
             # compare the monthly yield for the latest year with prev year
-            lines = alt.Chart(monthly_yield).mark_line(point=True).encode(
-                x=alt.X('Month_Name:N', title='', axis=alt.Axis(labelAngle=0), sort=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']),
-                tooltip=[alt.Tooltip('FFB_production:Q', format='.2s')],
-                y=alt.Y('FFB_production:Q', title='FFB production (tonnes)', axis=alt.Axis(format='.2s')),
-                color=alt.Color('Year:N', title='Year', scale=alt.Scale(range=color_palette), legend=alt.Legend(title='', orient='top')),
-                detail='Year:N'
-            ).properties(
-                width=600,
-                height=300
-            )
-
             st.subheader("Monthly FFB Production Comparison")
-            st.altair_chart(lines, use_container_width=True)
+            cached_altair_chart('production_comparison', 'FFB_production', monthly_yield, lambda: production_comparison(monthly_yield))
             
             # past years trend
             st.subheader("FFB Production 10 years trend")
-            chart = trend_10(yearly_yield, 'FFB_production')
-            st.altair_chart(chart, use_container_width=True)
+            cached_altair_chart('trend_10', 'FFB_production', yearly_yield, lambda: trend_10(yearly_yield, 'FFB_production'))
 
     with col[2]: # AI insights
+        # the arguments only key the cache, the payload comes from the enclosing scope;
+        # ingesting a month changes the fingerprints of the years it touched and no others
         @st.cache_data
-        def collect_dashboard_data():
-            key_metrics = {
-                'FFB Yield': {
-                    'Latest Year': latest_ffb,
-                    'Previous Year': prev_ffb,
-                    'Change (%)': ffb_change_pct
-                },
-                'CPO Yield': {
-                    'Latest Year': latest_cpo,
-                    'Previous Year': prev_cpo,
-                    'Change (%)': cpo_change_pct
-                },
-                'FFB Production': {
-                    'Latest Year': latest_prod,
-                    'Previous Year': prev_prod,
-                    'Change (%)': prod_change_pct
-                }
-            }
-
-            trends = {
-                'FFB Yield': yearly_yield[['Year', 'FFB_Yield']],
-                'CPO Yield': yearly_yield[['Year', 'CPO_Yield']],
-                'FFB Production': yearly_yield[['Year', 'FFB_production']]
-            }
-
-            monthly  = {
-                'FFB': this_year[['Month_Name', 'FFB_Yield', 'FFB_Yield_Category']],
-                'CPO': this_year[['Month_Name', 'CPO_Yield', 'CPO_Yield_Category']],
-                'FFB Production': this_year[['Month_Name', 'FFB_production', 'FFB_Production_Category']]
-            }
-
-            climate_data = {
-                'Precipitation': climate_info[['Year','Month_Name', 'pr']],
-                'Temperature': climate_info[['Year','Month_Name', 'tas']],
-                'Humidity': climate_info[['Year','Month_Name', 'hurs']],
-                'Max Temperature': climate_info[['Year','Month_Name', 'tasmax']],
-                'Min Temperature': climate_info[['Year','Month_Name', 'tasmin']],
-                'Cumalative Wet Days': climate_info[['Year','Month_Name', 'cwd']],
-                'Cumalative Dry Days': climate_info[['Year','Month_Name', 'cdd']],
-                'Summer Days': climate_info[['Year','Month_Name', 'sd']],
-            }
+        def collect_dashboard_data(selected_years, data_version):
+            return build_payload(data, yearly_yield, this_year, climate_info)
 
-            data = {
-                'key_metrics': str(key_metrics),
-                'trends': str(trends),
-                'monthly': str(monthly),
-                'climate': str(climate_data)
-            }
-            return data
-
-        project_id = st.secrets['jamAIbase']["project_id"]
-        pat = st.secrets['jamAIbase']["pat"]
-
-        client = JamAI(project_id, pat)
-        def generate_insights(input_data):         
-            
-            response = client.table.add_table_rows(
-                table_type=p.TableType.action,
-                request=p.RowAddRequest(
-                    table_id="AI_insights1",
-                    data=[input_data],
-                    stream=False,
-                ),
-            )
-            
-            return {
-                "message": response.rows[0].columns['Insight'].text
-        }
-        
-        def stream_data(input):
-            for word in input.split(" "):
-                yield word + " "
-                time.sleep(0.02)
-        
         st.subheader("AI Summary")
-        dashboard_data = collect_dashboard_data()
-            
-        
+        data_version = [fingerprint(frame) for frame in (yearly_yield, this_year, climate_info)]
+        dashboard_data = collect_dashboard_data(selected_years, data_version)
+        insights = get_insight_service()
+
         # st.write(dashboard_data)
         if st.button('Generate AI Summary'):
+            summary = st.empty()
+            tokens = insights.stream(dashboard_data)
             with st.spinner("Generating AI Summary..."):
-                ai_insight = generate_insights(dashboard_data)
-                to_write = ai_insight.get('message')
-                st.markdown(f"<div style='text-align: justify;'> {to_write} </div>", unsafe_allow_html=True)
-                # st.write_stream(stream_data(to_write))
-                # # st.markdown("", unsafe_allow_html=True)
+                to_write = next(tokens, '')
+            summary.markdown(f"<div style='text-align: justify;'> {to_write} </div>", unsafe_allow_html=True)
+            for token in tokens:
+                to_write += token
+                summary.markdown(f"<div style='text-align: justify;'> {to_write} </div>", unsafe_allow_html=True)
                 
 
-page1()
\ No newline at end of file
+with rerun('Dashboard', st.session_state):
+    page1()
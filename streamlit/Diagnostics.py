@@ -0,0 +1,57 @@
+import time
+import pandas as pd
+import streamlit as st
+import instrumentation
+from chart_cache import chart_cache
+from insight_service import get_insight_service
+from model_bundle import list_bundles
+from model_registry import registry
+from prediction_cache import manual_cache
+
+def page4():
+    st.title('Diagnostics 🩺')
+    st.caption('Stage timings of this server process since start, shared by every session.')
+
+    stages = pd.DataFrame.from_dict(instrumentation.summary(), orient='index')
+    if stages.empty:
+        st.info('Nothing recorded yet, open one of the other pages first.')
+    else:
+        st.dataframe(stages.sort_values('mean_ms', ascending=False).round(2), use_container_width=True)
+
+    cols = st.columns(3)
+    with cols[0]:
+        st.subheader('Chart specs')
+        st.json(chart_cache.stats())
+    with cols[1]:
+        st.subheader('Manual predictions')
+        st.json(manual_cache.stats())
+    with cols[2]:
+        st.subheader('Models and AI summaries')
+        st.json({'model_loads': registry.loads, 'models_held': len(registry.keys()), 'insights': get_insight_service().stats()})
+
+    st.subheader('Model bundles')
+    bundles = pd.DataFrame([
+        {'name': h['name'], 'version': h['version'], 'target': h['target'], 'features': len(h['features']),
+         'R²': h['metrics'].get('R²'), 'threshold': h['threshold'], 'content': h['content_hash'][:12], 'packed': h['packed_at']}
+        for h in list_bundles()
+    ])
+    st.dataframe(bundles, use_container_width=True, hide_index=True)
+
+    st.subheader('Prometheus')
+    if instrumentation.METRICS_PORT:
+        st.caption(f'Scrape http://{instrumentation.METRICS_HOST}:{instrumentation.METRICS_PORT}/metrics')
+    st.code(instrumentation.prometheus_text(), language='text')
+
+    st.subheader('Profiling')
+    # plain session key rather than the widget's, widget state is dropped when the page changes
+    profiling = st.toggle('Profile my page runs', value=bool(st.session_state.get('profile_reruns')),
+                          help='Every page run in this session is captured with cProfile, or pyinstrument if installed.')
+    st.session_state['profile_reruns'] = ('pyinstrument' if instrumentation.Profiler else 'cprofile') if profiling else None
+    if st.button('Reset timings'):
+        instrumentation.reset()
+        st.rerun()
+    for name, captured, report in reversed(instrumentation.profiles):
+        with st.expander(f"{name} at {time.strftime('%H:%M:%S', time.localtime(captured))}"):
+            st.code(report, language='text')
+
+page4()
@@ -1,28 +1,108 @@
-import joblib  # type: ignore
+import hashlib
+import os
+import altair as alt
 import pandas as pd
 import streamlit as st
+from features import manual_features, monthly_climatology
+from data_store import CLIMATE_FILES, input_hashes, open_store
+from instrumentation import rerun
+from batch_predict import DEFAULT_CHUNK_SIZE, predict_cached
+from prediction_cache import manual_cache
+from prediction_cube import load_cube
+from model_registry import read_header
+from inference_service import load_models
+from projection import FEATURES, MODEL_PATHS, SSP_SCENARIOS, TARGETS
+from scenario_runner import compare_scenarios, projection_results, run_scenarios
+from climate_dataset import load_climate_dataset
+from sensitivity import DEFAULT_POINTS, LABELS, SWEEP_VARIABLES, partial_dependence, sweep, variable_ranges
 
-@st.cache_data
-def load_data(path):
-    data = pd.read_csv(path)
-    return data
+def climate_version(scenarios=tuple(CLIMATE_FILES)):
+    # digests of the climate csvs, a cache key that only changes when months are ingested into one of them
+    return tuple(input_hashes(files=[CLIMATE_FILES[scenario] for scenario in scenarios]).values())
 
-def load_model(path):
-    model = joblib.load(path)
-    return model
+@st.cache_resource(max_entries=1)
+def load_store(version):
+    # memory-mapped columnar copy of the data CSVs, rebuilt when a CSV changes
+    return open_store()
+
+@st.cache_resource(ttl=600)
+def load_projection():
+    # precomputed 2015-2100 cube, rebuilt only when a model or SSP csv changes
+    return load_cube()
+
+@st.cache_data(max_entries=1)
+def load_climatology(version):
+    return monthly_climatology(load_store(version).climate('historical'))
+
+def load_scenario_results():
+    # read from the cube; a rescore asked for on the Compare tab replaces it for that session
+    if 'scenario_results' in st.session_state:
+        return st.session_state['scenario_results']
+    return projection_results(load_projection())
+
+@st.cache_data(max_entries=1)
+def load_sweep_ranges(version):
+    # observed historical and SSP range of every sweepable variable
+    return variable_ranges(load_climate_dataset().frame)
+
+def sensitivity_panel(base, background=None, key='sweep'):
+    # one or two variables swept around `base`, the whole grid scored in one batch per model
+    ranges = load_sweep_ranges(climate_version())
+    cols = st.columns(4)
+    x_var = cols[0].selectbox('Vary', SWEEP_VARIABLES, index=SWEEP_VARIABLES.index('tas'), format_func=LABELS.get, key=f'{key}_x')
+    y_var = cols[1].selectbox('Against', [None] + [v for v in SWEEP_VARIABLES if v != x_var], format_func=lambda v: LABELS.get(v, 'Nothing (curve)'), key=f'{key}_y')
+    target = cols[2].selectbox('Yield', TARGETS, format_func=lambda x: x.replace('_', ' '), key=f'{key}_target')
+    points = cols[3].slider('Grid points per variable', min_value=10, max_value=80, value=DEFAULT_POINTS, step=5, key=f'{key}_points')
+    models = load_models()
+    y_title = f"{target.replace('_', ' ')} (tons/ha)"
+
+    if y_var is None:
+        curve = sweep(models, base, [x_var], ranges, points).assign(Curve='This month')
+        if background is not None:
+            # partial dependence: averaged over all months of the year
+            average = partial_dependence(models, background, x_var, ranges, points).assign(Curve='Year average')
+            curve = pd.concat([curve, average], ignore_index=True)
+        chart = alt.Chart(curve).mark_line().encode(
+            x=alt.X(f'{x_var}:Q', title=LABELS[x_var], scale=alt.Scale(zero=False)),
+            y=alt.Y(f'{target}:Q', title=y_title, scale=alt.Scale(zero=False)),
+            color=alt.Color('Curve:N', scale=alt.Scale(range=['#fd8d3c', '#a1d99b']), legend=alt.Legend(title='', orient='top')),
+            tooltip=[alt.Tooltip(f'{x_var}:Q', format='.2f'), alt.Tooltip(f'{target}:Q', format='.3f')],
+        )
+    else:
+        grid = sweep(models, base, [x_var, y_var], ranges, points)
+        # each cell spans one grid step
+        for var in (x_var, y_var):
+            low, high = ranges[var]
+            grid[f'{var}_end'] = grid[var] + (high - low) / (points - 1)
+        chart = alt.Chart(grid).mark_rect().encode(
+            x=alt.X(f'{x_var}:Q', title=LABELS[x_var], scale=alt.Scale(zero=False, nice=False)),
+            x2=f'{x_var}_end:Q',
+            y=alt.Y(f'{y_var}:Q', title=LABELS[y_var], scale=alt.Scale(zero=False, nice=False)),
+            y2=f'{y_var}_end:Q',
+            color=alt.Color(f'{target}:Q', title=y_title, scale=alt.Scale(scheme='yellowgreen')),
+            tooltip=[alt.Tooltip(f'{x_var}:Q', format='.2f'), alt.Tooltip(f'{y_var}:Q', format='.2f'), alt.Tooltip(f'{target}:Q', format='.3f')],
+        )
+    st.altair_chart(chart.properties(height=350), use_container_width=True)
+
+def projection_band_chart(yearly, target, selected_year):
+    # yearly mean prediction with the spread of the forest's trees around it
+    label = target.replace('_', ' ')
+    base = alt.Chart(yearly).encode(x=alt.X('Year:Q', title='', axis=alt.Axis(format='d')))
+    band = base.mark_area(opacity=0.3, color='#a1d99b').encode(
+        y=alt.Y('Lower:Q', title=f'{label} (tons/ha)', scale=alt.Scale(zero=False)),
+        y2='Upper:Q',
+        tooltip=[alt.Tooltip('Year:Q'), alt.Tooltip('Lower:Q', format='.2f'), alt.Tooltip('Upper:Q', format='.2f')],
+    )
+    line = base.mark_line(color='#fd8d3c').encode(y='Prediction:Q')
+    rule = alt.Chart(pd.DataFrame({'Year': [selected_year]})).mark_rule(strokeDash=[4, 4]).encode(x='Year:Q')
+    return (band + line + rule).properties(height=220, title=f'{label}: yearly mean and 10th-90th percentile of trees')
 
 def page2():
     print('\n\n')
     print('---------------------------------------------Runing page Prediction Tool---------------------------------------------')
     st.title('Yield Prediction Tool 🔨')
     
-    # Load the prediction models
-    cpo_model_new = load_model('streamlit/cpo_yield_model5.pkl') 
-    ffb_model_new = load_model('streamlit/ffb_yield_model5.pkl') 
-     
-
-        
-    tabs = st.tabs(['Model Overview', 'Manual input', 'Climate Projections'])
+    tabs = st.tabs(['Model Overview', 'Manual input', 'Climate Projections', 'Compare Scenarios', 'Batch Prediction'])
     with tabs[0]:
         st.markdown("""
                     <div style="text-align: justify;">
@@ -47,20 +127,8 @@ def page2():
                     </div>
                     """, unsafe_allow_html=True)
         
-        evaluation_scores = {
-            'FFB Yield Model': {
-                'R²': 0.706,
-                'MAE': 0.106,
-                'MSE': 0.018,
-                'RMSE': 0.131,
-            },
-            'CPO Yield Model': {
-                'R²': 0.668,
-                'MAE': 0.025,
-                'MSE': 0.001,
-                'RMSE': 0.031,
-            }
-        }
+        # scores recorded in each model bundle's header
+        evaluation_scores = {f"{target.split('_')[0]} Yield Model": read_header(MODEL_PATHS[target])['metrics'] for target in TARGETS}
         df = pd.DataFrame(evaluation_scores)
         st.dataframe(df, height=175, width=550)
 
@@ -72,13 +140,9 @@ def page2():
         with col[0]:
             month = st.slider("Select Month of Harvest", min_value=1, max_value=12, value=1, step=1)
             pr = st.slider("Precipitation (mm)", min_value=0.0, max_value=500.0, value=100.0, step=0.001)
-            pr_3y = pr * 36
-            pr_2y = pr * 24
-            pr_1y = pr * 12
             tas = st.slider("Temperature (°C)", min_value=24.0, max_value=30.0, value=25.0, step=0.001)
             tasmin = st.slider("Minimum Temperature (°C)", min_value=22.0, max_value=tas, value=25.0, step=0.001)
             tasmax = st.slider("Maximum Temperature (°C)", min_value=tas, max_value=35.0, value=30.0, step=0.001)
-            tas_range = tasmax - tasmin
 
         # Place sliders in the second column
         with col[1]:
@@ -92,10 +156,12 @@ def page2():
         
         with col[2]:
             st.subheader('Predicted Yield')
-            # ffb_input_df = pd.DataFrame([[month, pr, pr_3y, tas, tasmin, tasmax, tas_range, hurs]], columns=['Month','pr', 'rolling_pr_3y', 'tas', 'tasmin', 'tasmax', 'tas_range', 'hurs'])
-            ffb_input_df = pd.DataFrame([[month, pr, prpercnt, hurs, spei12, tas, tasmin, tasmax, cdd, cwd, 30, tas_range, pr_3y, pr_2y, pr_1y]], columns=['Month', 'pr', 'prpercnt', 'hurs', 'spei12', 'tas', 'tasmin', 'tasmax','cdd', 'cwd', 'sd', 'tas_range', 'rolling_pr_3y', 'rolling_pr_2y', 'rolling_pr_1y'])
-            ffb_pred = ffb_model_new.predict(ffb_input_df)[0]
-            threshold_ffb = 1.38
+            # rolling precipitation continues from the historical monthly climatology
+            input_df = manual_features(month, pr, prpercnt, hurs, spei12, tas, tasmin, tasmax, cdd, cwd, 30, load_climatology(climate_version(['historical'])))
+            # repeated slider positions are served from the shared prediction cache
+            manual_pred = manual_cache.predict(input_df.to_numpy()[0])
+            ffb_pred = manual_pred['FFB_Yield']
+            threshold_ffb = read_header(MODEL_PATHS['FFB_Yield'])['threshold']
             st.metric(label="Predicted FFB Yield", 
                       value=f"{ffb_pred:.2f}  (tons/ha)", 
                       delta=f"{ffb_pred - threshold_ffb:.2f} compared to historical average",
@@ -103,23 +169,24 @@ def page2():
             st.divider()
             st.divider()
                 
-            # cpo_input_df = pd.DataFrame([[month, pr, pr_3y, tas, tasmin, tasmax, tas_range, hurs]], columns=['Month','pr', 'rolling_pr_3y', 'tas', 'tasmin', 'tasmax', 'tas_range', 'hurs'])
-            cpo_input_df = pd.DataFrame([[month, pr, prpercnt, hurs, spei12, tas, tasmin, tasmax, cdd, cwd, 30, tas_range, pr_3y, pr_2y, pr_1y]], columns=['Month', 'pr', 'prpercnt', 'hurs', 'spei12', 'tas', 'tasmin', 'tasmax','cdd', 'cwd', 'sd', 'tas_range', 'rolling_pr_3y', 'rolling_pr_2y', 'rolling_pr_1y'])
-            
-            cpo_pred = cpo_model_new.predict(cpo_input_df)[0]
-            threshold_cpo = 0.27
+            cpo_pred = manual_pred['CPO_Yield']
+            threshold_cpo = read_header(MODEL_PATHS['CPO_Yield'])['threshold']
             st.metric(label="Predicted CPO Yield", 
                       value=f"{cpo_pred:.2f}  (tons/ha)", 
                       delta=f"{(cpo_pred - threshold_cpo):.2f} compared to historical average",
                       border = True)
 
+        with st.expander('Sensitivity sweep'):
+            st.caption('How the prediction for these inputs changes as one or two climate variables move across their observed range.')
+            sensitivity_panel(input_df, key='manual_sweep')
+
         
     with tabs[2]:
         cols = st.columns((1, 1, 1), gap='medium')
         with cols[0]:
             # selct climate projections
             st.subheader('Climate Projections')
-            selected_ssp = st.segmented_control('Select SSP Scenario', options=['SSP126', 'SSP245', 'SSP370', 'SSP585'], default='SSP126')
+            selected_ssp = st.segmented_control('Select SSP Scenario', options=SSP_SCENARIOS, default='SSP126')
             selected_years = st.slider('Select Year', min_value=2025, max_value=2100, value=2025, step=1)
             selected_month = st.slider('Select Month', min_value=1, max_value=12, value=1, step=1)
             # Explanation of SSP
@@ -189,15 +256,16 @@ def page2():
             
         with cols[1]:
             # fetch SSP data 
-            ssp_df = pd.read_csv(f'streamlit/data/{selected_ssp.lower()}_climate4.csv')
-            ssp_input = ssp_df[(ssp_df['Year'] == selected_years) & (ssp_df['Month'] == selected_month)]
-            ssp_input = ssp_input[['Month', 'pr', 'prpercnt', 'hurs', 'spei12', 'tas', 'tasmin', 'tasmax','cdd', 'cwd', 'sd', 'tas_range', 'rolling_pr_3y', 'rolling_pr_2y', 'rolling_pr_1y']]
+            projection = load_projection()
+            ssp_input = projection.climate_row(selected_ssp, selected_years, selected_month)
+            ssp_pred = projection.predict(selected_ssp, selected_years, selected_month)
+            ssp_band = projection.interval(selected_ssp, selected_years, selected_month)
             month_names = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
             month_name = month_names[selected_month - 1]
             st.write(f'<h4>Projected Climate Data for {month_name} {selected_years}: </h4>', unsafe_allow_html=True)
             climate_data = {
                 'Metric': ['Precipitation (mm)', 'Temperature (°C)', 'Humidity (%)', 'Drought Index', 'Consecutive Dry Days', 'Consecutive Wet Days', 'Precipitation Percent Change', 'Temperature Range (°C)', 'Rolling Precipitation 3 Years (mm)', 'Rolling Precipitation 2 Years (mm)', 'Rolling Precipitation 1 Year (mm)'],
-                'Value': [f"{ssp_input['pr'].values[0]:.3f}", f"{ssp_input['tas'].values[0]:.3f}", f"{ssp_input['hurs'].values[0]:.3f}", f"{ssp_input['spei12'].values[0]:.3f}", f"{ssp_input['cdd'].values[0]:.3f}", f"{ssp_input['cwd'].values[0]:.3f}", f"{ssp_input['prpercnt'].values[0]:.3f}", f"{ssp_input['tas_range'].values[0]:.3f}", f"{ssp_input['rolling_pr_3y'].values[0]:.3f}", f"{ssp_input['rolling_pr_2y'].values[0]:.3f}", f"{ssp_input['rolling_pr_1y'].values[0]:.3f}"]
+                'Value': [f"{ssp_input['pr']:.3f}", f"{ssp_input['tas']:.3f}", f"{ssp_input['hurs']:.3f}", f"{ssp_input['spei12']:.3f}", f"{ssp_input['cdd']:.3f}", f"{ssp_input['cwd']:.3f}", f"{ssp_input['prpercnt']:.3f}", f"{ssp_input['tas_range']:.3f}", f"{ssp_input['rolling_pr_3y']:.3f}", f"{ssp_input['rolling_pr_2y']:.3f}", f"{ssp_input['rolling_pr_1y']:.3f}"]
             }
             climate_df = pd.DataFrame(climate_data)
             st.table(climate_df)
@@ -205,18 +273,89 @@ def page2():
             
         with cols[2]:
             st.subheader('Predicted Yield')
-            ffb_pred = ffb_model_new.predict(ssp_input)[0]
-            threshold_ffb = 1.38
+            ffb_pred = ssp_pred['FFB_Yield']
+            threshold_ffb = read_header(MODEL_PATHS['FFB_Yield'])['threshold']
             st.metric(label="Predicted FFB Yield", 
                       value=f"{ffb_pred:.2f}  (tons/ha)", 
                       delta=f"{ffb_pred - threshold_ffb:.2f} compared to historical average",
                       border = True)
+            st.caption(f"80% range: {ssp_band['FFB_Yield'][0]:.2f} - {ssp_band['FFB_Yield'][1]:.2f} tons/ha")
             st.divider()
                 
-            cpo_pred = cpo_model_new.predict(ssp_input)[0]
-            threshold_cpo = 0.27
+            cpo_pred = ssp_pred['CPO_Yield']
+            threshold_cpo = read_header(MODEL_PATHS['CPO_Yield'])['threshold']
             st.metric(label="Predicted CPO Yield", 
                       value=f"{cpo_pred:.2f}  (tons/ha)", 
                       delta=f"{cpo_pred - threshold_cpo:.2f} compared to historical average",
                       border = True)
-page2()
\ No newline at end of file
+            st.caption(f"80% range: {ssp_band['CPO_Yield'][0]:.2f} - {ssp_band['CPO_Yield'][1]:.2f} tons/ha")
+
+        cols = st.columns((1, 1), gap='medium')
+        for col, target in zip(cols, ['FFB_Yield', 'CPO_Yield']):
+            with col:
+                chart = projection_band_chart(projection.yearly(selected_ssp, target), target, selected_years)
+                st.altair_chart(chart, use_container_width=True)
+
+        with st.expander('Sensitivity sweep'):
+            st.caption(f'Around the projected climate of {month_name} {selected_years}; the year average is the partial dependence over all twelve months.')
+            sensitivity_panel(ssp_input, projection.climate_year(selected_ssp, selected_years), key='ssp_sweep')
+
+    with tabs[3]:
+        st.subheader('Compare Scenarios')
+        col = st.columns((1, 1), gap='medium')
+        with col[0]:
+            target = st.segmented_control('Yield', options=['FFB_Yield', 'CPO_Yield'], default='FFB_Yield', format_func=lambda x: x.replace('_', ' '))
+        with col[1]:
+            freq = st.segmented_control('Resolution', options=['Year', 'Decade'], default='Year')
+        # segmented controls return None when the selection is cleared
+        target = target or 'FFB_Yield'
+        freq = freq or 'Year'
+        if st.button('Rescore from the climate files', help='Score every scenario with every model again, in worker processes'):
+            with st.spinner('Scoring all SSP scenarios...'):
+                st.session_state['scenario_results'] = run_scenarios()
+        comparison = compare_scenarios(load_scenario_results(), target, freq)
+        lines = alt.Chart(comparison).mark_line(point=freq == 'Decade').encode(
+            x=alt.X(f'{freq}:O', title='', axis=alt.Axis(labelAngle=0, labelOverlap=True)),
+            y=alt.Y('Prediction:Q', title=f"Mean {target.replace('_', ' ')} (tons/ha)", scale=alt.Scale(zero=False)),
+            color=alt.Color('Scenario:N', legend=alt.Legend(title='', orient='top')),
+        ).properties(height=350)
+        st.altair_chart(lines, use_container_width=True)
+        st.dataframe(comparison.pivot(index=freq, columns='Scenario', values='Prediction'), height=250)
+
+    with tabs[4]:
+        st.subheader('Batch Prediction')
+        st.write('Upload a CSV or Parquet file of monthly climate rows with the columns:')
+        st.code(', '.join(FEATURES))
+        # a form, so the file is only scored on submit and not on every rerun of the page
+        with st.form('batch_prediction'):
+            uploaded = st.file_uploader('Climate file', type=['csv', 'parquet'])
+            chunk_size = st.number_input('Rows per batch', min_value=1000, max_value=1_000_000, value=DEFAULT_CHUNK_SIZE, step=1000)
+            submitted = st.form_submit_button('Predict')
+        if submitted and uploaded is None:
+            st.warning('Choose a file to predict.')
+        elif submitted:
+            progress = st.empty()
+            key = hashlib.sha256(uploaded.getbuffer()).hexdigest()
+            try:
+                # chunks are streamed to a csv kept per upload hash, never held together in memory
+                output = predict_cached(
+                    uploaded, key, chunk_size=int(chunk_size), models=load_models(),
+                    progress=lambda rows, rate: progress.write(f'{rows:,} rows predicted ({rate:,.0f} rows/s)'),
+                )
+            except ValueError as e:
+                st.session_state.pop('batch_output', None)
+                st.error(str(e))
+            else:
+                st.session_state['batch_output'] = output
+        output = st.session_state.get('batch_output')
+        if output and os.path.exists(output):
+            st.dataframe(pd.read_csv(output, nrows=100))
+
+            def download():
+                # read from disk on click, in the download's own thread
+                with open(output, 'rb') as f:
+                    return f.read()
+
+            st.download_button('Download predictions', download, file_name='yield_predictions.csv', mime='text/csv', on_click='ignore')
+with rerun('PredictionTool', st.session_state):
+    page2()
\ No newline at end of file
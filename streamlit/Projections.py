@@ -0,0 +1,50 @@
+import altair as alt
+import streamlit as st
+from downsample import build_levels, select_points
+from instrumentation import rerun
+from prediction_cube import load_cube
+from projection import END_YEAR, SSP_SCENARIOS, START_YEAR, TARGETS
+
+scenario_palette = ["#a1d99b", "#ffffcc", "#fd8d3c", "#e6550d"]
+
+@st.cache_resource(ttl=600)
+def load_levels():
+    # monthly, yearly and decadal levels of every scenario, built once from the cube
+    return build_levels(load_cube().to_frame(), TARGETS)
+
+def projection_trend(points, var, level):
+    y_title = f"{var.replace('_', ' ')} (tonnes/ha)"
+    lines = alt.Chart(points).mark_line(point=level == 'Decadal').encode(
+                x=alt.X('Time:Q', title='', axis=alt.Axis(format='d', labelAngle=0)),
+                y=alt.Y(f'{var}:Q', title=y_title, scale=alt.Scale(zero=False)),
+                color=alt.Color('Scenario:N', scale=alt.Scale(domain=SSP_SCENARIOS, range=scenario_palette), legend=alt.Legend(title='', orient='top')),
+                tooltip=['Scenario:N', alt.Tooltip('Time:Q', format='.1f', title='Year'), alt.Tooltip(f'{var}:Q', format='.3f')]
+            ).properties(
+                width=600,
+                height=300
+            )
+    return lines
+
+def page3():
+    st.title('Projected Yield Trends 📈')
+    st.write(f'Predicted FFB and CPO yield under each SSP scenario from {START_YEAR} to {END_YEAR}.')
+
+    col = st.columns((2, 1.2, 1), gap='medium')
+    with col[0]:
+        start_year, end_year = st.slider('Zoom (years)', min_value=START_YEAR, max_value=END_YEAR, value=(START_YEAR, END_YEAR), step=1)
+    with col[1]:
+        method = st.segmented_control('Downsampling', options=['LTTB', 'Min/Max', 'Mean'], default='LTTB') or 'LTTB'
+    with col[2]:
+        max_points = st.number_input('Points per scenario', min_value=50, max_value=1000, value=200, step=50)
+    scenarios = st.multiselect('Scenarios', options=SSP_SCENARIOS, default=SSP_SCENARIOS)
+
+    levels = load_levels()
+    levels = {level: frame[frame['Scenario'].isin(scenarios)] for level, frame in levels.items()}
+    for target in TARGETS:
+        # only the points Altair can draw smoothly are sent to the browser
+        points, level = select_points(levels, target, start_year, end_year, int(max_points), method)
+        st.subheader(f"{target.replace('_', ' ')} {start_year}-{end_year}")
+        st.altair_chart(projection_trend(points, target, level), use_container_width=True)
+        st.caption(f'{level} resolution, {len(points):,} points')
+with rerun('Projections', st.session_state):
+    page3()
@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 import time
 import pandas as pd
@@ -8,6 +9,8 @@ import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import calendar
 from millify import millify
+import instrumentation
+from projection import ensure_models
 
 st.set_page_config(
     page_title="Palm Yield Insight Dashboard",
@@ -20,8 +23,18 @@ pages = {
         st.Page('About.py', title='About'),
         st.Page('Dashboard.py', title='Dashboard'),
         st.Page('PredictionTool.py', title='Prediction Tool'),
+        st.Page('Projections.py', title='Projections'),
     ]
 }
 
+# diagnostics stays out of the menu unless asked for, e.g. /?diagnostics=1 (remembered for the session)
+if 'diagnostics' in st.query_params:
+    st.session_state['show_diagnostics'] = True
+if os.environ.get('SHOW_DIAGNOSTICS') or st.session_state.get('show_diagnostics'):
+    pages['Admin'] = [st.Page('Diagnostics.py', title='Diagnostics', url_path='diagnostics')]
+
+instrumentation.start_metrics_server()
+# packs a model bundle the first time its pickle is seen, else just a stat per model
+ensure_models()
 pg = st.navigation(pages)
 pg.run()
@@ -0,0 +1,207 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed  # type: ignore
+from sklearn.base import clone
+
+from climate_dataset import load_climate_dataset
+from data_store import CLIMATE_FILES, DATA_DIR, KEY_COLUMNS, PALM_OIL_FILE, atomic_save, atomic_write_json, input_hashes, open_store
+from features import FEATURES
+from instrumentation import timer
+from model_registry import file_digest, load_model, read_header
+from projection import MODEL_PATHS, TARGETS, ensure_models, load_models
+
+# bump when the cached feature matrix changes
+MATRIX_VERSION = 2
+# Month is both a key and a model feature
+MATRIX_COLUMNS = ['Year'] + FEATURES + TARGETS
+SOURCE_FILES = [PALM_OIL_FILE, CLIMATE_FILES['historical']]
+MIN_TRAIN_YEARS = 10
+
+
+def default_cache_dir(data_dir=DATA_DIR):
+    return f'{data_dir}/backtest'
+
+
+@timer('backtest.features')
+def build_matrix(data_dir=DATA_DIR):
+    # historical climate features joined with the yields on (Year, Month); the rolling
+    # sums run over the whole climate record, so the first yield year has full windows
+    dataset = load_climate_dataset(data_dir, ['historical'])
+    rows = dataset.rows('historical')
+    climate = dataset.features('historical').assign(Year=dataset.year[rows])
+    palm_oil = open_store(data_dir).palm_oil()[KEY_COLUMNS + TARGETS].dropna()
+    matrix = climate.merge(palm_oil, on=KEY_COLUMNS).sort_values(KEY_COLUMNS)
+    return matrix[MATRIX_COLUMNS].to_numpy(dtype=np.float64)
+
+
+def load_matrix(data_dir=DATA_DIR, cache_dir=None):
+    """The joined (Year, Month, features, targets) frame, cached on disk and
+    rebuilt only when palm_oil.csv or the historical climate csv changed."""
+    cache_dir = cache_dir or default_cache_dir(data_dir)
+    inputs = input_hashes(data_dir, SOURCE_FILES)
+    try:
+        with open(f'{cache_dir}/manifest.json') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest is None or manifest.get('version') != MATRIX_VERSION or manifest['inputs'] != inputs:
+        os.makedirs(cache_dir, exist_ok=True)
+        atomic_save(f'{cache_dir}/matrix.npy', build_matrix(data_dir))
+        atomic_write_json(f'{cache_dir}/manifest.json', {'version': MATRIX_VERSION, 'inputs': inputs, 'columns': MATRIX_COLUMNS})
+    matrix = pd.DataFrame(np.load(f'{cache_dir}/matrix.npy'), columns=MATRIX_COLUMNS)
+    return matrix.astype({col: np.int64 for col in KEY_COLUMNS})
+
+
+def scores(actual, predicted):
+    # the figures PredictionTool reports for each model
+    error = np.asarray(predicted) - np.asarray(actual)
+    mse = float(np.mean(error ** 2))
+    total = float(np.sum((actual - np.mean(actual)) ** 2))
+    return {
+        'R²': 1 - float(np.sum(error ** 2)) / total if total else np.nan,
+        'MAE': float(np.mean(np.abs(error))),
+        'MSE': mse,
+        'RMSE': mse ** 0.5,
+        'n': len(error),
+    }
+
+
+def _estimator(model):
+    # the fitted pipeline of a search object, which clone() resets to its hyperparameters
+    return getattr(model, 'best_estimator_', model)
+
+
+def fold_key(target, path, train, test):
+    # a fold's predictions depend only on the model artifact and its train and test rows
+    sha = hashlib.sha256(f'{target}:{file_digest(path)}'.encode())
+    for frame in (train, test):
+        sha.update(np.ascontiguousarray(frame[MATRIX_COLUMNS].to_numpy(dtype=np.float64)).tobytes())
+    return sha.hexdigest()
+
+
+def _fold(origin, horizon, target, path, train, test, cached=None):
+    # runs in a worker: refit the model's pipeline on the years before `origin`, score the next `horizon`;
+    # the predictions are kept at `cached`, so a fold whose inputs are unchanged isn't refit
+    if cached and os.path.exists(cached):
+        prediction = np.load(cached)
+    else:
+        estimator = clone(_estimator(load_model(path)))
+        estimator.fit(train[FEATURES], train[target])
+        prediction = estimator.predict(test[FEATURES])
+        if cached:
+            atomic_save(cached, prediction)
+    return pd.DataFrame({
+        'Origin': origin,
+        'Year': test['Year'].to_numpy(),
+        'Month': test['Month'].to_numpy(),
+        'Target': target,
+        'Actual': test[target].to_numpy(),
+        'Prediction': prediction,
+    })
+
+
+def fold_jobs(matrix, model_paths=MODEL_PATHS, min_train_years=MIN_TRAIN_YEARS, horizon=1):
+    # one job per origin year and target: train on every earlier year, test on the next `horizon` years
+    years = np.unique(matrix['Year'])
+    for origin in years[min_train_years:]:
+        train = matrix[matrix['Year'] < origin]
+        test = matrix[(matrix['Year'] >= origin) & (matrix['Year'] < origin + horizon)]
+        for target, path in model_paths.items():
+            yield int(origin), horizon, target, path, train, test
+
+
+@timer('backtest.rolling_origin')
+def rolling_origin(matrix, model_paths=MODEL_PATHS, min_train_years=MIN_TRAIN_YEARS, horizon=1, n_jobs=-1, fold_dir=None):
+    """Out-of-sample predictions from expanding-window refits, folds fanned
+    out over worker processes. Each row is one test month of one fold.
+
+    With `fold_dir`, each fold's predictions are kept there under its
+    fold_key: a rerun refits only the folds whose model or rows changed,
+    e.g. the new origin after a year is ingested. Files no fold of this
+    run uses are removed."""
+    jobs = list(fold_jobs(matrix, model_paths, min_train_years, horizon))
+    cached = [None] * len(jobs)
+    if fold_dir:
+        os.makedirs(fold_dir, exist_ok=True)
+        cached = [f'{fold_dir}/{fold_key(*job[2:])}.npy' for job in jobs]
+        for path in set(glob.glob(f'{fold_dir}/*.npy')) - set(cached):
+            os.unlink(path)
+    results = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_fold)(*job, path) for job, path in zip(jobs, cached)
+    )
+    return pd.concat(results, ignore_index=True)
+
+
+@timer('backtest.deployed')
+def deployed(matrix, model_paths=MODEL_PATHS):
+    # the shipped models over every joined month, one batch per model; in-sample for the months they were trained on
+    models = load_models(model_paths)
+    return pd.concat([
+        pd.DataFrame({
+            'Year': matrix['Year'], 'Month': matrix['Month'], 'Target': target,
+            'Actual': matrix[target], 'Prediction': models[target].predict(matrix[FEATURES]),
+        })
+        for target in model_paths
+    ], ignore_index=True)
+
+
+def summarize(predictions, by=None):
+    # error scores per target, and per year or month when `by` is given
+    keys = ['Target'] + ([by] if by else [])
+    rows = [
+        {**dict(zip(keys, group if isinstance(group, tuple) else (group,))), **scores(frame['Actual'], frame['Prediction'])}
+        for group, frame in predictions.groupby(keys, sort=True)
+    ]
+    return pd.DataFrame(rows)
+
+
+def run_backtest(data_dir=DATA_DIR, model_paths=MODEL_PATHS, min_train_years=MIN_TRAIN_YEARS, horizon=1, n_jobs=-1, refit=False):
+    ensure_models()
+    matrix = load_matrix(data_dir)
+    fold_dir = None if refit else f'{default_cache_dir(data_dir)}/folds'
+    rolling = rolling_origin(matrix, model_paths, min_train_years, horizon, n_jobs, fold_dir)
+    return {
+        'matrix': matrix,
+        'deployed': deployed(matrix, model_paths),
+        'rolling': rolling,
+        'overall': summarize(rolling),
+        'by_year': summarize(rolling, 'Year'),
+        'by_month': summarize(rolling, 'Month'),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest the yield models on historical climate and MPOB yields.')
+    parser.add_argument('--output', help='csv file for the rolling-origin predictions')
+    parser.add_argument('--min-train-years', type=int, default=MIN_TRAIN_YEARS, help='years before the first origin (default: %(default)s)')
+    parser.add_argument('--horizon', type=int, default=1, help='years scored after each origin (default: %(default)s)')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='worker processes (default: all cores)')
+    parser.add_argument('--refit', action='store_true', help='refit every fold instead of reusing unchanged ones')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = run_backtest(min_train_years=args.min_train_years, horizon=args.horizon, n_jobs=args.n_jobs, refit=args.refit)
+    matrix = result['matrix']
+    print(f"{len(matrix)} months, {matrix['Year'].min()}-{matrix['Year'].max()}, "
+          f"{result['rolling']['Origin'].nunique()} folds in {time.perf_counter() - start:.1f}s\n")
+    pd.set_option('display.width', 120)
+    print('Deployed models, every month (in-sample where they were trained on it):')
+    # the R² recorded in each bundle's header
+    reported = {target: read_header(path)['metrics'].get('R²') for target, path in MODEL_PATHS.items()}
+    print(summarize(result['deployed']).assign(Reported=lambda d: d['Target'].map(reported)).round(3).to_string(index=False))
+    print('\nRolling origin, refit on earlier years:')
+    print(result['overall'].round(3).to_string(index=False))
+    print('\nBy year:')
+    print(result['by_year'].round(3).to_string(index=False))
+    print('\nBy month:')
+    print(result['by_month'].round(3).to_string(index=False))
+    if args.output:
+        result['rolling'].to_csv(args.output, index=False)
+        print(f"\nWrote {len(result['rolling']):,} predictions to {args.output}")
@@ -0,0 +1,138 @@
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from features import RAW_COLUMNS, RollingPrecipitation, add_features
+from instrumentation import timer
+from projection import FEATURES, TARGETS, load_models
+
+DEFAULT_CHUNK_SIZE = 100_000
+# predicted uploads, one csv per upload hash, dropped a day after they were written
+OUTPUT_DIR = f'{tempfile.gettempdir()}/palm_yield_batches'
+OUTPUT_TTL = 24 * 3600
+
+
+def read_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE, file_format=None):
+    # source is a path or file-like object; only one chunk is held in memory at a time
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    file_format = file_format or ('parquet' if str(name).endswith('.parquet') else 'csv')
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq  # type: ignore
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size)
+
+
+def validate(chunk, offset=0):
+    missing = [col for col in FEATURES if col not in chunk.columns]
+    if missing:
+        raise ValueError(f'Missing climate columns: {", ".join(missing)}')
+
+    X = chunk[FEATURES].apply(pd.to_numeric, errors='coerce')
+    bad = X.isna().any(axis=1).to_numpy()
+    if bad.any():
+        rows = (np.flatnonzero(bad)[:5] + offset + 1).tolist()
+        raise ValueError(f'Non-numeric or empty feature values in rows {rows}')
+    months = X['Month'].to_numpy()
+    if ((months < 1) | (months > 12)).any():
+        raise ValueError('Month must be between 1 and 12')
+    return X
+
+
+def predict_chunks(chunks, models):
+    # FFB and CPO share the validated feature frame of each chunk
+    offset = 0
+    rolling = RollingPrecipitation()
+    for chunk in chunks:
+        if all(col in chunk.columns for col in RAW_COLUMNS[1:]) and 'rolling_pr_1y' not in chunk.columns:
+            # raw monthly climate in date order: derive tas_range and rolling sums across chunks
+            chunk = add_features(chunk, rolling)
+        X = validate(chunk, offset)
+        with timer('model.predict'):
+            for target in TARGETS:
+                chunk[target] = models[target].predict(X)
+        offset += len(chunk)
+        yield chunk
+
+
+def predict_file(source, output, chunk_size=DEFAULT_CHUNK_SIZE, models=None, progress=None):
+    models = models or load_models()
+    start = time.perf_counter()
+    rows = 0
+    writer = None
+    try:
+        for i, chunk in enumerate(predict_chunks(read_chunks(source, chunk_size), models)):
+            if output.endswith('.parquet'):
+                import pyarrow as pa  # type: ignore
+                import pyarrow.parquet as pq  # type: ignore
+
+                # a column's inferred type can differ between chunks (whole numbers read as int64),
+                # so features and predictions are float64 and later chunks take the first one's schema
+                table = pa.Table.from_pandas(chunk.astype({col: np.float64 for col in FEATURES + TARGETS}), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output, table.schema)
+                else:
+                    table = table.cast(writer.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(output, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            rows += len(chunk)
+            if progress:
+                progress(rows, rows / (time.perf_counter() - start))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    seconds = time.perf_counter() - start
+    return {'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds if seconds else 0.0}
+
+
+def predict_cached(source, key, output_dir=OUTPUT_DIR, chunk_size=DEFAULT_CHUNK_SIZE, models=None, progress=None):
+    """Path of a csv with the predictions for `source`, streamed there chunk
+    by chunk. `key` names the file (the upload's hash), so a file already
+    predicted by any session is served without scoring it again."""
+    os.makedirs(output_dir, exist_ok=True)
+    expired = time.time() - OUTPUT_TTL
+    for path in glob.glob(f'{output_dir}/*.csv'):
+        try:
+            if os.path.getmtime(path) < expired:
+                os.unlink(path)
+        except OSError:
+            pass  # removed by another process
+    output = f'{output_dir}/{key}.csv'
+    if not os.path.exists(output):
+        # concurrent sessions predicting the same upload each write their own temp file
+        tmp = f'{output_dir}/{key}.{uuid.uuid4().hex}.tmp.csv'
+        try:
+            predict_file(source, tmp, chunk_size, models, progress)
+            os.replace(tmp, output)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Predict FFB and CPO yield for a file of monthly climate rows.')
+    parser.add_argument('input', help='csv or parquet file with the 15 model features, or raw monthly climate in date order')
+    parser.add_argument('output', help='csv or parquet file to write the predictions to')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows per batch (default: %(default)s)')
+    args = parser.parse_args()
+
+    try:
+        stats = predict_file(
+            args.input, args.output, args.chunk_size,
+            progress=lambda rows, rate: print(f'{rows:,} rows ({rate:,.0f} rows/s)'),
+        )
+    except ValueError as e:
+        sys.exit(f'error: {e}')
+    print(f"Wrote {stats['rows']:,} rows to {args.output} in {stats['seconds']:.2f}s ({stats['rows_per_second']:,.0f} rows/s)")
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+from instrumentation import observe, timer
+
+# Altair's active theme is process-wide; builds that switch it hold this lock so
+# another session's build can't see or restore it midway
+_theme_lock = threading.Lock()
+
+
+def fingerprint(data):
+    # content hash of a frame: columns, dtypes and values
+    digest = hashlib.sha256()
+    digest.update(repr([(col, str(dtype)) for col, dtype in data.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ChartCache:
+    """Vega-Lite spec dicts keyed on (chart kind, variable, data fingerprint),
+    bounded LRU. Altair only builds and serializes on a miss; a hit returns
+    the cached dict itself, which callers must not modify."""
+
+    def __init__(self, maxsize=128, on_serialize=None):
+        self.maxsize = maxsize
+        # called as on_serialize(kind, var, seconds, size) after every miss
+        self.on_serialize = on_serialize
+        self.hits = 0
+        self.misses = 0
+        self.timings = {}
+        self._specs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind, var, data, build):
+        key = (kind, var, fingerprint(data))
+        with self._lock:
+            if key in self._specs:
+                self.hits += 1
+                self._specs.move_to_end(key)
+                return self._specs[key]
+            self.misses += 1
+
+        start = time.perf_counter()
+        # same as st.altair_chart: drop the default theme's width/height config
+        with _theme_lock, alt.theme.enable('none') if alt.theme.active == 'default' else nullcontext():
+            text = build().to_json()
+        spec = json.loads(text)
+        seconds = time.perf_counter() - start
+
+        with self._lock:
+            self._specs[key] = spec
+            while len(self._specs) > self.maxsize:
+                self._specs.popitem(last=False)
+            count, total = self.timings.get(kind, (0, 0.0))
+            self.timings[kind] = (count + 1, total + seconds)
+        if self.on_serialize:
+            self.on_serialize(kind, var, seconds, len(text))
+        return spec
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._specs),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'serialize_ms': {kind: total / count * 1000 for kind, (count, total) in self.timings.items()},
+            }
+
+
+chart_cache = ChartCache(on_serialize=lambda kind, var, seconds, size: observe(f'chart.serialize.{kind}', seconds))
+
+
+def cached_altair_chart(kind, var, data, build, cache=chart_cache):
+    # build: zero-argument callable returning the Altair chart for `data`
+    with timer('chart.render'):
+        st.vega_lite_chart(cache.get(kind, var, data, build), use_container_width=True)
@@ -0,0 +1,170 @@
+import copy
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import CLIMATE_FILES, DATA_DIR, KEY_COLUMNS, input_hashes, month_rows, open_store
+from features import FEATURES, ROLLING_WINDOWS, RollingPrecipitation, add_features
+from ingest import appended_since
+from instrumentation import timer
+
+# the model features, in model order, so a row slice of the matrix is model input
+SCHEMA = FEATURES
+# float64 like the csvs: the model's scaler works in float64 before its trees cast to
+# float32, so float32 inputs would move some predictions
+DTYPE = np.float64
+DERIVED_COLUMNS = ['tas_range'] + list(ROLLING_WINDOWS)
+
+
+def normalize(climate, rolling):
+    # derive what a file lacks (historical has no tas_range or rolling sums) and fill spei12;
+    # either way `rolling` is left holding the last months of precipitation
+    if climate[DERIVED_COLUMNS].isna().all().all():
+        return add_features(climate, rolling)
+    rolling.update(climate['pr'].to_numpy())
+    return climate.assign(spei12=climate['spei12'].fillna(0.0))
+
+
+class ClimateDataset:
+    """Every climate scenario under one canonical schema, held as a single
+    float64 (rows x SCHEMA) matrix sorted by (scenario, year, month).
+
+    A scenario, year or month is a contiguous row range found by binary
+    search, and the frames handed out are views of the matrix."""
+
+    def __init__(self, frames, version=None):
+        # frames: {scenario: climate frame with Year, Month and the raw columns}
+        years, months, values = [], [], []
+        self.ranges = {}
+        # per scenario, the rolling precipitation state after its last month
+        self._rolling = {}
+        start = 0
+        for scenario, climate in frames.items():
+            self._rolling[scenario] = RollingPrecipitation()
+            climate = normalize(climate.sort_values(KEY_COLUMNS, ignore_index=True), self._rolling[scenario])
+            years.append(climate['Year'].to_numpy(dtype=np.int64))
+            months.append(climate['Month'].to_numpy(dtype=np.int64))
+            values.append(climate[SCHEMA].to_numpy(dtype=DTYPE))
+            self.ranges[scenario] = (start, start + len(climate))
+            start += len(climate)
+        self._set(np.concatenate(values), np.concatenate(years), np.concatenate(months))
+        # digests of the scenario files this was built from
+        self.version = version or {}
+
+    def _set(self, values, year, month):
+        self.values, self.year, self.month = values, year, month
+        for array in (self.values, self.year, self.month):
+            array.flags.writeable = False
+        # months since year 0, increasing within each scenario's range
+        self._period = self.year * 12 + self.month - 1
+
+    def append(self, scenario, climate):
+        """A new dataset with months added to the end of `scenario`. Their
+        tas_range and rolling sums continue from the scenario's carried state;
+        no existing row is recomputed."""
+        climate = climate.sort_values(KEY_COLUMNS, ignore_index=True)
+        start, stop = self.ranges[scenario]
+        if stop > start and climate['Year'][0] * 12 + climate['Month'][0] - 1 <= self._period[stop - 1]:
+            raise ValueError(f'Only months after the last one can be appended to {scenario}')
+        rolling = copy.deepcopy(self._rolling[scenario])
+        climate = normalize(climate, rolling)
+
+        dataset = copy.copy(self)
+        def insert(old, new):
+            return np.concatenate([old[:stop], new, old[stop:]])
+
+        dataset._set(
+            insert(self.values, climate[SCHEMA].to_numpy(dtype=DTYPE)),
+            insert(self.year, climate['Year'].to_numpy(dtype=np.int64)),
+            insert(self.month, climate['Month'].to_numpy(dtype=np.int64)),
+        )
+        # scenarios after this one move down by the new rows
+        added = len(climate)
+        dataset.ranges = {
+            name: (a, b + added) if name == scenario else (a + added, b + added) if a >= stop else (a, b)
+            for name, (a, b) in self.ranges.items()
+        }
+        dataset._rolling = {**self._rolling, scenario: rolling}
+        return dataset
+
+    @timer('load.climate_refresh')
+    def refresh(self, data_dir=DATA_DIR):
+        """This dataset if no scenario file changed, else one with the months
+        ingested since it was built appended. A file changed other than by
+        ingestion means a full rebuild."""
+        hashes = input_hashes(data_dir, self.version)
+        if hashes == self.version:
+            return self
+        store = open_store(data_dir)
+        dataset = self
+        for scenario in self.scenarios:
+            name = CLIMATE_FILES[scenario]
+            if hashes[name] == self.version[name]:
+                continue
+            keys = appended_since(name, self.version[name], data_dir)
+            if keys is None:
+                return _build(data_dir, self.scenarios)
+            climate = store.climate(scenario)
+            dataset = dataset.append(scenario, climate[pd.MultiIndex.from_frame(climate[KEY_COLUMNS]).isin(keys)])
+        dataset = copy.copy(dataset)
+        dataset.version = hashes
+        return dataset
+
+    @property
+    def scenarios(self):
+        return list(self.ranges)
+
+    def rows(self, scenario, year=None, month=None):
+        return month_rows(self._period, self.ranges[scenario], year, month)
+
+    def features(self, scenario, year=None, month=None):
+        # model input for a scenario, year or month; no copy of the matrix
+        return pd.DataFrame(self.values[self.rows(scenario, year, month)], columns=SCHEMA, copy=False)
+
+    def row(self, scenario, year, month):
+        rows = self.rows(scenario, year, month)
+        if rows.stop - rows.start != 1:
+            raise KeyError((scenario, year, month))
+        return pd.Series(self.values[rows.start], index=SCHEMA)
+
+    def scenario_frame(self, scenario):
+        # Year plus the schema columns, for code that filters by year
+        rows = self.rows(scenario)
+        frame = self.features(scenario)
+        frame.insert(0, 'Year', self.year[rows])
+        return frame
+
+    @property
+    def index(self):
+        scenario = np.repeat(np.arange(len(self.ranges)), [stop - start for start, stop in self.ranges.values()])
+        return pd.MultiIndex.from_arrays(
+            [pd.Categorical.from_codes(scenario, self.scenarios), self.year, self.month],
+            names=['Scenario', 'Year', 'Month'],
+        )
+
+    @property
+    def frame(self):
+        # the whole matrix with a sorted (Scenario, Year, Month) MultiIndex
+        return pd.DataFrame(self.values, index=self.index, columns=SCHEMA, copy=False)
+
+
+@timer('load.climate_dataset')
+def _build(data_dir, scenarios):
+    version = input_hashes(data_dir, [CLIMATE_FILES[scenario] for scenario in scenarios])
+    store = open_store(data_dir)
+    return ClimateDataset({scenario: store.climate(scenario) for scenario in scenarios}, version)
+
+
+_datasets = {}
+_lock = threading.Lock()
+
+
+def load_climate_dataset(data_dir=DATA_DIR, scenarios=None):
+    # one dataset per data dir and scenario list in each process, brought up to date with ingested months
+    key = (data_dir, tuple(scenarios or CLIMATE_FILES))
+    with _lock:
+        dataset = _datasets.get(key)
+        dataset = _build(*key) if dataset is None else dataset.refresh(data_dir)
+        _datasets[key] = dataset
+    return dataset
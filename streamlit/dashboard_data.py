@@ -0,0 +1,208 @@
+import calendar
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_store import CLIMATE_FILES, KEY_COLUMNS, PALM_OIL_FILE, input_hashes, open_store
+from ingest import appended_since
+from instrumentation import timer
+
+DATA_DIR = 'streamlit/data'
+MONTH_NAMES = list(calendar.month_abbr)[1:]
+MONTH_DTYPE = pd.CategoricalDtype(MONTH_NAMES, ordered=True)
+YIELD_COLUMNS = ['FFB_Yield', 'CPO_Yield', 'FFB_production']
+CATEGORY_COLUMNS = ['FFB_Yield_Category', 'CPO_Yield_Category', 'FFB_Production_Category']
+HARVEST_DTYPE = pd.CategoricalDtype(['Peak Harvest', 'Above Average', 'Below Average'])
+# the source csvs a dashboard dataset is built from
+SOURCE_FILES = [PALM_OIL_FILE, CLIMATE_FILES['historical'], CLIMATE_FILES['SSP126']]
+
+
+def add_month_name(data):
+    # vectorized month labels instead of a per-row calendar.month_abbr apply
+    data['Month_Name'] = pd.Categorical.from_codes(data['Month'].to_numpy() - 1, dtype=MONTH_DTYPE)
+    return data
+
+
+def _freeze(frame):
+    # mark the underlying buffers read-only so shared frames can't be edited in place
+    for col in frame:
+        values = frame[col].array
+        values = values.codes if isinstance(values, pd.Categorical) else values.to_numpy()
+        while isinstance(values.base, np.ndarray):
+            values = values.base
+        values.flags.writeable = False
+    return frame
+
+
+class DashboardDataset:
+    """Merged and labelled dashboard frames, built once and shared read-only."""
+
+    def __init__(self, palm_oil, climate_info, version=None, index=None):
+        self._palm_oil = _freeze(palm_oil)
+        self._climate_info = _freeze(climate_info)
+        self.years = sorted(palm_oil['Year'].unique().tolist())
+        self.index = index or YieldIndex(palm_oil)
+        # digests of SOURCE_FILES when this was built
+        self.version = version or {}
+
+    # shallow copies: new columns stay local to the caller, the data is shared
+    @property
+    def palm_oil(self):
+        return self._palm_oil.copy(deep=False)
+
+    @property
+    def climate_info(self):
+        return self._climate_info.copy(deep=False)
+
+    @timer('load.dashboard_refresh')
+    def refresh(self, data_dir=DATA_DIR):
+        """This dataset if no source csv changed since it was built, else one
+        with the ingested months: the yield index only recomputes the years
+        that gained months and the climate window is re-read only when a
+        climate file changed. A file changed other than by ingestion means a
+        full rebuild."""
+        hashes = input_hashes(data_dir, self.version)
+        if hashes == self.version:
+            return self
+        store = open_store(data_dir)
+        palm_oil, index = self._palm_oil, self.index
+        if hashes[PALM_OIL_FILE] != self.version[PALM_OIL_FILE]:
+            keys = appended_since(PALM_OIL_FILE, self.version[PALM_OIL_FILE], data_dir)
+            if keys is None:
+                return build_dataset(data_dir)
+            palm_oil = add_month_name(store.palm_oil())
+            index = index.append(palm_oil[pd.MultiIndex.from_frame(palm_oil[KEY_COLUMNS]).isin(keys)])
+        climate_info = self._climate_info
+        if any(hashes[name] != self.version[name] for name in SOURCE_FILES[1:]):
+            climate_info = climate_window(store)
+        return DashboardDataset(palm_oil, climate_info, hashes, index)
+
+
+def harvest_codes(values, avg_value, highest_value):
+    # whole-array categorisation; arguments broadcast, so (rows x metrics) works in one pass
+    values = np.asarray(values)
+    codes = np.select([values < avg_value, values == highest_value], [2, 0], default=1)
+    return codes.astype(np.int8)
+
+
+def harvest_category(values, avg_value, highest_value):
+    return pd.Categorical.from_codes(harvest_codes(values, avg_value, highest_value), dtype=HARVEST_DTYPE)
+
+
+class YieldIndex:
+    """Yearly totals, changes, monthly max/mean and harvest categories for
+    every year, held in arrays indexed by year so a slider move is a lookup."""
+
+    def __init__(self, palm_oil, base=None, keep=0):
+        # the first `keep` years are copied from `base`, an index over the same rows for those years
+        palm_oil = palm_oil.sort_values(['Year', 'Month']).reset_index(drop=True)
+        row_years = palm_oil['Year'].to_numpy()
+        self.first_year = int(row_years.min())
+        self.years = np.arange(self.first_year, int(row_years.max()) + 1)
+        # row range of each year in the sorted monthly frame
+        self.starts = np.searchsorted(row_years, self.years, side='left')
+        self.stops = np.searchsorted(row_years, self.years, side='right')
+        cut = self.starts[keep] if keep < len(self.years) else len(palm_oil)
+
+        yearly = palm_oil.iloc[cut:].groupby('Year').sum(numeric_only=True).reindex(self.years[keep:]).reset_index()
+        yearly['Year'] = yearly['Year'].astype(int)
+        # per-year slices rather than groupby().mean() so the figures match
+        # the plain Series.mean() the metrics were always computed with
+        values = palm_oil[YIELD_COLUMNS]
+        ranges = list(zip(self.starts[keep:], self.stops[keep:]))
+        monthly_max = np.array([values.iloc[a:b].max().to_numpy() for a, b in ranges]).reshape(-1, len(YIELD_COLUMNS))
+        monthly_mean = np.array([values.iloc[a:b].mean().to_numpy() for a, b in ranges]).reshape(-1, len(YIELD_COLUMNS))
+        if keep:
+            yearly = pd.concat([base._yearly.iloc[:keep], yearly], ignore_index=True)
+            monthly_max = np.concatenate([base.monthly_max[:keep], monthly_max])
+            monthly_mean = np.concatenate([base.monthly_mean[:keep], monthly_mean])
+        self.monthly_max, self.monthly_mean = monthly_max, monthly_mean
+        self.totals = yearly[YIELD_COLUMNS].to_numpy()
+        self.change_pct = np.full_like(self.totals, np.nan)
+        self.change_pct[1:] = (self.totals[1:] - self.totals[:-1]) / self.totals[:-1] * 100
+
+        # categorise every month of every year for all three metrics at once
+        pos = row_years[cut:] - self.first_year
+        codes = harvest_codes(values.to_numpy()[cut:], self.monthly_mean[pos], self.monthly_max[pos])
+        categories = pd.DataFrame({
+            category: pd.Categorical.from_codes(codes[:, i], dtype=HARVEST_DTYPE)
+            for i, category in enumerate(CATEGORY_COLUMNS)
+        })
+        if keep:
+            categories = pd.concat([base._categories.iloc[:cut], categories], ignore_index=True)
+
+        self._palm_oil = _freeze(palm_oil)
+        self._yearly = _freeze(yearly)
+        self._categories = _freeze(categories)
+
+    def append(self, rows):
+        """A new index with `rows` added, new months or ones that replace
+        empty placeholders. Years before the first one touched keep their
+        figures; only that year and later ones are recomputed."""
+        replaced = pd.MultiIndex.from_frame(self._palm_oil[KEY_COLUMNS]).isin(pd.MultiIndex.from_frame(rows[KEY_COLUMNS]))
+        palm_oil = pd.concat([self._palm_oil[~replaced], rows[self._palm_oil.columns]], ignore_index=True)
+        keep = min(max(self._pos(rows['Year'].min()), 0), len(self.years))
+        return YieldIndex(palm_oil, self, keep)
+
+    def _pos(self, year):
+        return int(year) - self.first_year
+
+    def yearly_yield(self, latest_year, span=10):
+        pos = self._pos(latest_year)
+        return self._yearly.iloc[max(pos - span + 1, 0):pos + 1].copy(deep=False)
+
+    def monthly_yield(self, latest_year):
+        # the latest year and the one before it
+        pos = self._pos(latest_year)
+        start = self.starts[max(pos - 1, 0)]
+        return self._palm_oil.iloc[start:self.stops[pos]].reset_index(drop=True)
+
+    def this_year(self, year):
+        pos = self._pos(year)
+        rows = slice(self.starts[pos], self.stops[pos])
+        frame = pd.concat([self._palm_oil.iloc[rows], self._categories.iloc[rows]], axis=1)
+        return frame.reset_index(drop=True)
+
+    def metrics(self, year):
+        pos = self._pos(year)
+        latest, prev, change = self.totals[pos], self.totals[pos - 1], self.change_pct[pos]
+        highest, avg = self.monthly_max[pos], self.monthly_mean[pos]
+        return {
+            'latest_year': int(year),
+            'prev_year': int(year) - 1,
+            'latest_ffb': latest[0], 'prev_ffb': prev[0], 'ffb_change_pct': change[0],
+            'latest_cpo': latest[1], 'prev_cpo': prev[1], 'cpo_change_pct': change[1],
+            'latest_prod': latest[2], 'prev_prod': prev[2], 'prod_change_pct': change[2],
+            'highest_monthly_ffb': highest[0], 'highest_monthly_cpo': highest[1], 'highest_monthly_prod': highest[2],
+            'avg_monthly_ffb': avg[0], 'avg_monthly_cpo': avg[1], 'avg_monthly_prod': avg[2],
+        }
+
+
+def climate_window(store, climate_years=10):
+    # historical then SSP126 climate, observed months first where they overlap, last `climate_years` years
+    climate_info = pd.concat([store.climate('historical'), store.climate('SSP126')], ignore_index=True)
+    climate_info = climate_info.drop_duplicates(KEY_COLUMNS, ignore_index=True)
+    earliest_year = climate_info['Year'].max() - (climate_years - 1)
+    climate_info = climate_info[climate_info['Year'] >= earliest_year].reset_index(drop=True)
+    return add_month_name(climate_info)
+
+
+@timer('load.dashboard_dataset')
+def build_dataset(data_dir=DATA_DIR, climate_years=10):
+    version = input_hashes(data_dir, SOURCE_FILES)
+    store = open_store(data_dir)
+    palm_oil = add_month_name(store.palm_oil())
+    return DashboardDataset(palm_oil, climate_window(store, climate_years), version)
+
+
+@st.cache_resource
+def _latest():
+    # the dataset sessions currently share, replaced as months are ingested
+    return {'dataset': build_dataset()}
+
+
+def get_dataset():
+    latest = _latest()
+    latest['dataset'] = latest['dataset'].refresh()
+    return latest['dataset']
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from features import RAW_COLUMNS, ROLLING_WINDOWS
+from instrumentation import timer
+from model_registry import file_digest
+
+DATA_DIR = 'streamlit/data'
+# bump when the files written by build_store change
+STORE_VERSION = 1
+CLIMATE_FILES = {
+    'historical': 'historical_climate_v4.csv',
+    'SSP126': 'ssp126_climate4.csv',
+    'SSP245': 'ssp245_climate4.csv',
+    'SSP370': 'ssp370_climate4.csv',
+    'SSP585': 'ssp585_climate4.csv',
+}
+PALM_OIL_FILE = 'palm_oil.csv'
+KEY_COLUMNS = ['Year', 'Month']
+# one column order for every scenario; columns a file lacks are NaN
+CLIMATE_COLUMNS = RAW_COLUMNS[2:] + ['tas_range'] + list(ROLLING_WINDOWS)
+PALM_OIL_COLUMNS = ['FFB_Yield', 'FFB_production', 'CPO_Yield']
+
+
+def default_store_dir(data_dir=DATA_DIR):
+    return f'{data_dir}/store'
+
+
+def input_hashes(data_dir=DATA_DIR, files=None):
+    files = files or [PALM_OIL_FILE] + list(CLIMATE_FILES.values())
+    return {name: file_digest(f'{data_dir}/{name}') for name in files}
+
+
+def read_manifest(store_dir):
+    try:
+        with open(f'{store_dir}/manifest.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(data_dir=DATA_DIR, store_dir=None):
+    manifest = read_manifest(store_dir or default_store_dir(data_dir))
+    return manifest is None or manifest.get('version') != STORE_VERSION or manifest['inputs'] != input_hashes(data_dir)
+
+
+def _read(path, columns):
+    # (Year, Month) keys and float64 values in the store's column order
+    frame = pd.read_csv(path).sort_values(KEY_COLUMNS, ignore_index=True)
+    keys = frame[KEY_COLUMNS].to_numpy(dtype=np.int64)
+    return keys, frame.reindex(columns=columns).to_numpy(dtype=np.float64)
+
+
+def atomic_write(path, write, mode='wb', before_replace=None):
+    # replace rather than overwrite, readers may still have the old file mapped; the
+    # temp name is unique so concurrent builds in other processes never share one.
+    # before_replace(tmp) runs on the finished file while `path` still has the old one
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp, mode) as f:
+            write(f)
+        if before_replace is not None:
+            before_replace(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def atomic_save(path, array):
+    atomic_write(path, lambda f: np.save(f, array))
+
+
+def atomic_write_json(path, obj):
+    atomic_write(path, lambda f: json.dump(obj, f, indent=2), mode='w')
+
+
+def _reusable(previous, hashes, names):
+    # the arrays built from `names` by the previous build are still current
+    return (previous is not None and previous.get('version') == STORE_VERSION
+            and all(previous['inputs'].get(name) == hashes[name] for name in names))
+
+
+@timer('load.store_build')
+def build_store(data_dir=DATA_DIR, store_dir=None, force=False):
+    # rewrites the palm oil arrays, the climate arrays or both, whichever inputs changed
+    store_dir = store_dir or default_store_dir(data_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    hashes = input_hashes(data_dir)
+    previous = None if force else read_manifest(store_dir)
+
+    if not _reusable(previous, hashes, [PALM_OIL_FILE]):
+        palm_keys, palm_values = _read(f'{data_dir}/{PALM_OIL_FILE}', PALM_OIL_COLUMNS)
+        atomic_save(f'{store_dir}/palm_oil_keys.npy', palm_keys)
+        atomic_save(f'{store_dir}/palm_oil.npy', palm_values)
+
+    if _reusable(previous, hashes, CLIMATE_FILES.values()):
+        ranges = previous['ranges']
+    else:
+        # scenarios stacked in CLIMATE_FILES order, each sorted by (Year, Month)
+        keys, values, ranges = [], [], {}
+        start = 0
+        for scenario, name in CLIMATE_FILES.items():
+            scenario_keys, scenario_values = _read(f'{data_dir}/{name}', CLIMATE_COLUMNS)
+            keys.append(scenario_keys)
+            values.append(scenario_values)
+            ranges[scenario] = [start, start + len(scenario_keys)]
+            start += len(scenario_keys)
+        atomic_save(f'{store_dir}/climate_keys.npy', np.concatenate(keys))
+        atomic_save(f'{store_dir}/climate.npy', np.concatenate(values))
+
+    manifest = {
+        'version': STORE_VERSION,
+        'inputs': hashes,
+        'palm_oil_columns': PALM_OIL_COLUMNS,
+        'climate_columns': CLIMATE_COLUMNS,
+        'ranges': ranges,
+    }
+    # written last so a half-built store is never picked up as fresh
+    atomic_write_json(f'{store_dir}/manifest.json', manifest)
+    return manifest
+
+
+def month_rows(period, bounds, year=None, month=None):
+    # rows of one scenario's (start, stop) range, or of one year or month within it;
+    # `period` is months since year 0, increasing within the range
+    start, stop = bounds
+    if year is None:
+        return slice(start, stop)
+    lo = year * 12 + (month - 1 if month else 0)
+    hi = lo + 1 if month else lo + 12
+    period = period[start:stop]
+    return slice(start + int(np.searchsorted(period, lo)), start + int(np.searchsorted(period, hi)))
+
+
+def _frame(keys, values, columns):
+    # the value block stays a view of the memory map; only the keys are new columns
+    frame = pd.DataFrame(values, columns=columns, copy=False)
+    frame.insert(0, 'Month', keys[:, 1])
+    frame.insert(0, 'Year', keys[:, 0])
+    return frame
+
+
+class DataStore:
+    """Memory-mapped columnar copy of the CSVs in streamlit/data: palm oil
+    yields and every climate scenario under one schema, with rows sorted by
+    (scenario, year, month) so any scenario, year or month is a slice."""
+
+    def __init__(self, store_dir):
+        self.manifest = read_manifest(store_dir)
+        self.climate_columns = self.manifest['climate_columns']
+        self.palm_oil_columns = self.manifest['palm_oil_columns']
+        self.ranges = {scenario: tuple(bounds) for scenario, bounds in self.manifest['ranges'].items()}
+        self._palm_keys = np.load(f'{store_dir}/palm_oil_keys.npy', mmap_mode='r')
+        self._palm_values = np.load(f'{store_dir}/palm_oil.npy', mmap_mode='r')
+        self._keys = np.load(f'{store_dir}/climate_keys.npy', mmap_mode='r')
+        self._values = np.load(f'{store_dir}/climate.npy', mmap_mode='r')
+        # months since year 0, increasing within each scenario's range
+        self._period = self._keys[:, 0] * 12 + self._keys[:, 1] - 1
+
+    @property
+    def scenarios(self):
+        return list(self.ranges)
+
+    def rows(self, scenario, year=None, month=None):
+        # slice of the stacked climate rows for a scenario, optionally one year or one month
+        return month_rows(self._period, self.ranges[scenario], year, month)
+
+    def climate(self, scenario, year=None, month=None):
+        rows = self.rows(scenario, year, month)
+        return _frame(self._keys[rows], self._values[rows], self.climate_columns)
+
+    def palm_oil(self):
+        return _frame(self._palm_keys, self._palm_values, self.palm_oil_columns)
+
+
+@timer('load.store_open')
+def open_store(data_dir=DATA_DIR, store_dir=None):
+    # rebuild only when a source csv hash changed, then memory-map the arrays
+    store_dir = store_dir or default_store_dir(data_dir)
+    if is_stale(data_dir, store_dir):
+        build_store(data_dir, store_dir)
+    return DataStore(store_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the data CSVs into the memory-mapped columnar store.')
+    parser.add_argument('--force', action='store_true', help='rebuild even if the CSVs are unchanged')
+    args = parser.parse_args()
+
+    if args.force or is_stale():
+        manifest = build_store(force=args.force)
+        print(f"Built data store for {', '.join(manifest['ranges'])} in {default_store_dir()}")
+    else:
+        print('Data store is up to date')
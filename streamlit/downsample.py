@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+LEVELS = ['Monthly', 'Yearly', 'Decadal']
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual shape
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = [0]
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # average of the next bucket is the third triangle vertex
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        a = keep[-1]
+        area = np.abs((x[a] - next_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (next_y - y[a]))
+        keep.append(start + int(np.argmax(area)))
+    keep.append(n - 1)
+    return np.array(keep)
+
+
+def minmax(y, n_out):
+    # lowest and highest point of each bucket, so peaks and troughs survive
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    buckets = np.array_split(np.arange(n), max(n_out // 2, 1))
+    keep = set()
+    for bucket in buckets:
+        keep.update((bucket[np.argmin(y[bucket])], bucket[np.argmax(y[bucket])]))
+    return np.array(sorted(keep))
+
+
+def build_levels(frame, value_columns, group_columns=('Scenario',)):
+    # monthly rows plus yearly and decadal means, each with a numeric Time axis
+    group_columns = list(group_columns)
+    monthly = frame.assign(Time=frame['Year'] + (frame['Month'] - 0.5) / 12)
+    yearly = frame.groupby(group_columns + ['Year'], as_index=False)[value_columns].mean()
+    yearly['Time'] = yearly['Year'] + 0.5
+    decadal = frame.assign(Year=frame['Year'] // 10 * 10).groupby(group_columns + ['Year'], as_index=False)[value_columns].mean()
+    decadal['Time'] = decadal['Year'] + 5
+    return {
+        'Monthly': monthly.sort_values(group_columns + ['Time'], ignore_index=True),
+        'Yearly': yearly,
+        'Decadal': decadal,
+    }
+
+
+def select_points(levels, value_column, start_year, end_year, max_points, method='LTTB', group_column='Scenario'):
+    """Points of one value column between two years, at most max_points per group.
+
+    The monthly level is used whenever it fits the budget. Otherwise it is
+    reduced with LTTB or min/max, or method='Mean' falls back to the finest
+    pre-aggregated level that fits."""
+    def window(level):
+        frame = levels[level]
+        return frame[(frame['Time'] >= start_year) & (frame['Time'] < end_year + 1)]
+
+    monthly = window('Monthly')
+    per_group = monthly.groupby(group_column).size().max() if len(monthly) else 0
+    if per_group <= max_points:
+        return monthly[[group_column, 'Time', value_column]], 'Monthly'
+
+    if method == 'Mean':
+        for level in LEVELS[1:]:
+            frame = window(level)
+            if frame.groupby(group_column).size().max() <= max_points or level == LEVELS[-1]:
+                return frame[[group_column, 'Time', value_column]], level
+
+    parts = []
+    for _, group in monthly.groupby(group_column, sort=False):
+        x = group['Time'].to_numpy()
+        y = group[value_column].to_numpy()
+        keep = lttb(x, y, max_points) if method == 'LTTB' else minmax(y, max_points)
+        parts.append(group.iloc[keep])
+    return pd.concat(parts)[[group_column, 'Time', value_column]], f'Monthly ({method})'
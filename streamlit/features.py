@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import timer
+
+FEATURES = ['Month', 'pr', 'prpercnt', 'hurs', 'spei12', 'tas', 'tasmin', 'tasmax', 'cdd', 'cwd', 'sd', 'tas_range', 'rolling_pr_3y', 'rolling_pr_2y', 'rolling_pr_1y']
+RAW_COLUMNS = ['Year', 'Month', 'pr', 'prpercnt', 'hurs', 'spei12', 'tas', 'tasmin', 'tasmax', 'cdd', 'cwd', 'sd']
+ROLLING_WINDOWS = {'rolling_pr_3y': 36, 'rolling_pr_2y': 24, 'rolling_pr_1y': 12}
+MAX_WINDOW = max(ROLLING_WINDOWS.values())
+
+
+class RollingPrecipitation:
+    """Trailing 1/2/3-year precipitation sums that carry the last 35 months
+    between updates, so appending a month never rescans the series.
+
+    Windows are partial at the start of a series (like rolling(min_periods=1)).
+    Each output sums the same values in the same order whether the series is
+    fed in one go or month by month, so batch and streaming results match."""
+
+    def __init__(self, history=()):
+        # leading zeros stand in for the months before the series started
+        self._tail = np.zeros(MAX_WINDOW - 1)
+        if len(history):
+            self.update(history)
+
+    def update(self, pr):
+        pr = np.asarray(pr, dtype=float)
+        series = np.concatenate([self._tail, pr])
+        self._tail = series[-(MAX_WINDOW - 1):]
+        windows = np.lib.stride_tricks.sliding_window_view(series, MAX_WINDOW)
+        return {name: windows[:, MAX_WINDOW - size:].sum(axis=1) for name, size in ROLLING_WINDOWS.items()}
+
+
+@timer('features.add')
+def add_features(climate, rolling=None, spei_fill=0.0):
+    # derive tas_range and the rolling sums from raw monthly climate, sorted by (Year, Month)
+    rolling = rolling or RollingPrecipitation()
+    climate = climate.copy()
+    climate['tas_range'] = climate['tasmax'] - climate['tasmin']
+    for name, values in rolling.update(climate['pr'].to_numpy()).items():
+        climate[name] = values
+    # spei12 is undefined for the first 11 months of a record; 0 is "normal"
+    climate['spei12'] = pd.to_numeric(climate['spei12'], errors='coerce').fillna(spei_fill)
+    return climate
+
+
+def build_features(climate, spei_fill=0.0):
+    # one code path for historical, SSP and uploaded climate
+    climate = climate.sort_values(['Year', 'Month']).reset_index(drop=True)
+    return add_features(climate, spei_fill=spei_fill)
+
+
+def stream_features(chunks, spei_fill=0.0):
+    # long series: the rolling state is carried from one chunk to the next
+    rolling = RollingPrecipitation()
+    for chunk in chunks:
+        yield add_features(chunk, rolling, spei_fill)
+
+
+def monthly_climatology(climate):
+    # mean of each raw variable per calendar month
+    return climate.groupby('Month')[RAW_COLUMNS[2:]].mean()
+
+
+@timer('features.manual')
+def manual_features(month, pr, prpercnt, hurs, spei12, tas, tasmin, tasmax, cdd, cwd, sd, climatology):
+    # the rolling sums assume the 35 months before `month` had typical rainfall
+    prior_months = (np.arange(month - MAX_WINDOW + 1, month) - 1) % 12 + 1
+    rolling = RollingPrecipitation(climatology.loc[prior_months, 'pr'].to_numpy())
+    sums = rolling.update([pr])
+    row = [month, pr, prpercnt, hurs, spei12, tas, tasmin, tasmax, cdd, cwd, sd, tasmax - tasmin,
+           sums['rolling_pr_3y'][0], sums['rolling_pr_2y'][0], sums['rolling_pr_1y'][0]]
+    return pd.DataFrame([row], columns=FEATURES)
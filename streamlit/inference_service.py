@@ -0,0 +1,329 @@
+import argparse
+import ipaddress
+import os
+import queue
+import signal
+import stat
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import AuthenticationError, get_context
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import observe
+from model_registry import load_model, read_header
+from projection import MODEL_PATHS, ensure_models, load_models as load_local_models
+from tree_backend import compiled_model
+
+# a unix socket path, or 'host:port' / ':port' over TCP; unset means every process predicts in-process
+INFERENCE_SERVICE = os.environ.get('YIELD_INFERENCE_SERVICE')
+# connections unpickle what they receive, so TCP is refused without a shared key
+AUTHKEY = os.environ.get('YIELD_INFERENCE_AUTHKEY', '').encode() or None
+# in a directory only this user can write to, so no other user can put a socket at the path
+RUNTIME_DIR = os.environ.get('XDG_RUNTIME_DIR') or f'{tempfile.gettempdir()}/palm_yield-{os.getuid()}'
+DEFAULT_ADDRESS = f'{RUNTIME_DIR}/palm_yield_inference.sock'
+# a batch closes after this many rows or this long after its first request
+MAX_BATCH_ROWS = 4096
+MAX_WAIT = 0.002
+# rows per worker task, so one large batch is spread over every worker
+CHUNK_ROWS = 512
+
+
+def parse_address(address):
+    # ':port' listens on loopback only
+    host, sep, port = address.rpartition(':')
+    return (host or '127.0.0.1', int(port)) if sep and port.isdigit() else address
+
+
+def _is_loopback(host):
+    try:
+        return host == 'localhost' or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_address(address, authkey=AUTHKEY, allow_remote=False):
+    """The parsed address, or ValueError for a TCP address without an
+    authkey, and for one off this host unless `allow_remote`."""
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        if not authkey:
+            raise ValueError('A TCP inference service needs YIELD_INFERENCE_AUTHKEY set on the server and every client')
+        if not allow_remote and not _is_loopback(address[0]):
+            raise ValueError(f'{address[0]} is not a loopback address; pass --allow-remote to serve other hosts')
+    return address
+
+
+def check_socket_dir(path):
+    """Creates the directory of a unix socket path private to this user, or
+    raises ValueError for a directory where another user could replace the
+    socket: one they own, or one they can write to without the sticky bit."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    owned = st.st_uid in (os.getuid(), 0)
+    if not owned or (st.st_mode & 0o022 and not st.st_mode & stat.S_ISVTX):
+        raise ValueError(f'Other users can replace files in {directory}; serve from a private directory')
+
+
+def check_socket_owner(path):
+    # a socket another user created would be sent our requests and answer with
+    # pickles of its choosing, so only this user's are connected to
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f'{path} belongs to another user')
+
+
+def _model(path):
+    # the compiled forest memory-mapped from the bundle, so every worker shares the
+    # same physical pages; estimators the compiled backend can't handle are unpickled
+    try:
+        return compiled_model(path)
+    except TypeError:
+        return load_model(path)
+
+
+def _init_worker(paths):
+    for path in paths:
+        _model(path)
+
+
+def _predict(path, X):
+    return _model(path).predict(X)
+
+
+class InferenceServer:
+    """Local prediction service: a pool of worker processes that hold each
+    served model once, behind a socket that any number of app processes and
+    sessions connect to. Requests that arrive within MAX_WAIT of each other
+    are stacked into one batch per model and split across the workers."""
+
+    def __init__(self, model_paths, address=DEFAULT_ADDRESS, workers=None, max_batch_rows=MAX_BATCH_ROWS, max_wait=MAX_WAIT,
+                 authkey=AUTHKEY, allow_remote=False):
+        self.model_paths = list(model_paths)
+        self.address = address
+        self.authkey = authkey
+        self._address = check_address(address, authkey, allow_remote)
+        if isinstance(self._address, str):
+            check_socket_dir(self._address)
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self.workers = workers or os.cpu_count()
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self._queue = queue.Queue()
+        # spawned rather than forked: the server process runs threads
+        self._pool = ProcessPoolExecutor(self.workers, get_context('spawn'), _init_worker, (self.model_paths,))
+        self._replies = ThreadPoolExecutor(4, thread_name_prefix='inference-reply')
+        self._listener = None
+
+    def stats(self):
+        return {
+            'paths': self.model_paths, 'workers': self.workers,
+            'requests': self.requests, 'batches': self.batches, 'rows': self.rows,
+        }
+
+    def serve_forever(self):
+        unix = isinstance(self._address, str)
+        if unix and os.path.exists(self._address):
+            os.unlink(self._address)  # socket left by a previous run
+        # workers start and map the models before the first request is accepted
+        wait([self._pool.submit(os.getpid) for _ in range(self.workers)])
+        # the socket is created 0600, only this user's processes may connect
+        umask = os.umask(0o177) if unix else None
+        try:
+            self._listener = Listener(self._address, authkey=self.authkey)
+        finally:
+            if unix:
+                os.umask(umask)
+        threading.Thread(target=self._batch_loop, name='inference-batcher', daemon=True).start()
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return  # closed
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+        self._pool.shutdown(cancel_futures=True)
+
+    def _handle(self, conn):
+        # one thread per connection; a connection's requests are answered in order
+        with conn:
+            while True:
+                try:
+                    op, path, X = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if op == 'stats':
+                    conn.send(('ok', self.stats()))
+                    continue
+                if path not in self.model_paths:
+                    conn.send(('error', f'{path} is not served'))
+                    continue
+                reply = Future()
+                self._queue.put((path, np.asarray(X, dtype=np.float64), reply))
+                try:
+                    conn.send(('ok', reply.result()))
+                except Exception as exc:
+                    conn.send(('error', f'{type(exc).__name__}: {exc}'))
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            rows = len(batch[0][1])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch_rows:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item[1])
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        # one stacked matrix per model, in chunks over the workers
+        self.requests += len(batch)
+        self.batches += 1
+        by_path = defaultdict(list)
+        for path, X, reply in batch:
+            by_path[path].append((X, reply))
+            self.rows += len(X)
+        for path, items in by_path.items():
+            X = np.concatenate([x for x, _ in items])
+            chunks = [self._pool.submit(_predict, path, X[i:i + CHUNK_ROWS]) for i in range(0, len(X), CHUNK_ROWS)]
+            self._replies.submit(self._reply, items, chunks)
+
+    @staticmethod
+    def _reply(items, chunks):
+        try:
+            predictions = np.concatenate([chunk.result() for chunk in chunks])
+        except Exception as exc:
+            for _, reply in items:
+                reply.set_exception(exc)
+            return
+        bounds = np.cumsum([len(x) for x, _ in items])[:-1]
+        for (_, reply), values in zip(items, np.split(predictions, bounds)):
+            reply.set_result(values)
+
+
+class InferenceClient:
+    """Client of an InferenceServer. Each thread (each session's script run)
+    gets its own connection, so sessions don't queue behind one another."""
+
+    def __init__(self, address, authkey=AUTHKEY):
+        self.address = address
+        self.authkey = authkey
+        self._address = check_address(address, authkey, allow_remote=True)
+        self._local = threading.local()
+        self._served = None
+
+    def _call(self, op, path=None, X=None):
+        # connecting is inside the try: a stopped service has removed its socket, and
+        # every way of not reaching it is a ConnectionError that callers fall back on
+        try:
+            if getattr(self._local, 'conn', None) is None:
+                if isinstance(self._address, str):
+                    check_socket_owner(self._address)
+                self._local.conn = Client(self._address, authkey=self.authkey)
+            self._local.conn.send((op, path, X))
+            status, value = self._local.conn.recv()
+        except (EOFError, OSError, AuthenticationError) as exc:
+            conn, self._local.conn = getattr(self._local, 'conn', None), None
+            if conn is not None:
+                conn.close()
+            self._served = None
+            raise ConnectionError(f'Inference service at {self.address} is unreachable: {exc}') from exc
+        if status == 'error':
+            raise ValueError(value)
+        return value
+
+    def predict(self, path, X):
+        start = time.perf_counter()
+        predictions = self._call('predict', path, X)
+        observe('model.predict_remote', time.perf_counter() - start)
+        return predictions
+
+    def stats(self):
+        return self._call('stats')
+
+    def served(self):
+        # paths the service holds, asked once per connection to it
+        if self._served is None:
+            self._served = set(self.stats()['paths'])
+        return self._served
+
+
+class RemoteModel:
+    """predict() of a served bundle; columns are put in the order of its header."""
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.feature_names = read_header(path)['features'] if os.path.isdir(path) else None
+
+    def predict(self, X):
+        if isinstance(X, pd.DataFrame) and self.feature_names:
+            X = X[self.feature_names]
+        try:
+            return self.client.predict(self.path, np.asarray(X, dtype=np.float64))
+        except ConnectionError:
+            # the service was stopped: answer in-process rather than fail the page
+            return load_model(self.path).predict(X)
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(address=INFERENCE_SERVICE):
+    with _lock:
+        if address not in _clients:
+            _clients[address] = InferenceClient(address)
+        return _clients[address]
+
+
+def load_models(model_paths=MODEL_PATHS, address=INFERENCE_SERVICE, **kwargs):
+    """Models for the pages: proxies to the inference service when one is
+    configured and serves every path, else loaded in this process as before."""
+    if address:
+        try:
+            served = get_client(address).served()
+        except (ConnectionError, OSError):
+            served = set()
+        if served.issuperset(model_paths.values()):
+            return {target: RemoteModel(get_client(address), path) for target, path in model_paths.items()}
+    return load_local_models(model_paths, **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve yield model predictions to the app processes on this host.')
+    parser.add_argument('--address', default=INFERENCE_SERVICE or DEFAULT_ADDRESS,
+                        help='unix socket path, or host:port / :port for TCP, which needs YIELD_INFERENCE_AUTHKEY (default: %(default)s)')
+    parser.add_argument('--allow-remote', action='store_true', help='allow a TCP address other hosts can reach')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('models', nargs='*', help='model bundles to serve (default: the app models)')
+    args = parser.parse_args()
+
+    try:
+        server = InferenceServer(args.models or list(ensure_models().values()), args.address, args.workers, allow_remote=args.allow_remote)
+    except ValueError as e:
+        sys.exit(f'error: {e}')
+    print(f'Serving {len(server.model_paths)} models on {args.address} with {server.workers} workers')
+    # a terminated server takes its worker processes with it
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
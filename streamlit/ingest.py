@@ -0,0 +1,173 @@
+import argparse
+import fcntl
+import json
+import shutil
+import sys
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from data_store import CLIMATE_FILES, DATA_DIR, KEY_COLUMNS, PALM_OIL_COLUMNS, PALM_OIL_FILE, atomic_write, open_store
+from features import RAW_COLUMNS
+from instrumentation import timer
+from model_registry import file_digest
+
+# one line per ingest: the file, its digest before and after, and the months added
+JOURNAL = 'ingest_log.jsonl'
+LOCK_FILE = '.ingest.lock'
+HISTORICAL_FILE = CLIMATE_FILES['historical']
+SOURCES = {
+    'palm_oil': (PALM_OIL_FILE, PALM_OIL_COLUMNS),
+    'climate': (HISTORICAL_FILE, RAW_COLUMNS[2:]),
+}
+# values a new row may leave empty; the climate features fill them like the historical file's
+OPTIONAL_COLUMNS = {'spei12'}
+
+
+def _period(keys):
+    return keys[:, 0] * 12 + keys[:, 1] - 1
+
+
+def validate(rows, existing, columns):
+    """Checks new monthly rows against the file they extend and returns them
+    as a (Year, Month, *columns) frame in month order. The rows must continue
+    the file without gaps from its last filled month; trailing months the file
+    holds as empty placeholders may be filled, any other existing month may not
+    be overwritten."""
+    missing = [col for col in KEY_COLUMNS + columns if col not in rows.columns]
+    if missing:
+        raise ValueError(f'Missing columns: {", ".join(missing)}')
+    if rows.empty:
+        raise ValueError('No rows to ingest')
+
+    rows = rows[KEY_COLUMNS + columns].apply(pd.to_numeric, errors='coerce')
+    required = KEY_COLUMNS + [col for col in columns if col not in OPTIONAL_COLUMNS]
+    bad = rows[required].isna().any(axis=1).to_numpy()
+    if bad.any():
+        raise ValueError(f'Non-numeric or empty values in rows {(np.flatnonzero(bad)[:5] + 1).tolist()}')
+    months = rows['Month'].to_numpy()
+    if ((months < 1) | (months > 12)).any():
+        raise ValueError('Month must be between 1 and 12')
+    if (rows[KEY_COLUMNS] % 1 != 0).any().any():
+        raise ValueError('Year and Month must be whole numbers')
+
+    rows = rows.astype({col: np.int64 for col in KEY_COLUMNS}).sort_values(KEY_COLUMNS, ignore_index=True)
+    period = _period(rows[KEY_COLUMNS].to_numpy())
+    if (np.diff(period) == 0).any():
+        raise ValueError('Duplicate months in the new rows')
+    if (np.diff(period) != 1).any():
+        raise ValueError('The new rows skip a month')
+
+    filled = existing.dropna(how='all', subset=columns)
+    if len(filled):
+        last = int(_period(filled[KEY_COLUMNS].to_numpy(dtype=np.int64)).max())
+        if period[0] <= last:
+            raise ValueError(f'{rows.Year[0]}-{rows.Month[0]:02d} is already in the data; ingestion only appends')
+        if period[0] != last + 1:
+            raise ValueError(f'The new rows must start at the month after {last // 12}-{last % 12 + 1:02d}')
+    return rows
+
+
+def _rewrite_csv(frame):
+    # whole-file replace, used when placeholder months are filled in
+    return lambda f: frame.to_csv(f, index=False)
+
+
+def _append_csv(path, rows):
+    # the old file followed by the new rows, as one new file
+    def write(f):
+        with open(path) as old:
+            shutil.copyfileobj(old, f)
+        rows.to_csv(f, header=False, index=False)
+    return write
+
+
+@contextmanager
+def _ingesting(data_dir):
+    # one ingest at a time per data dir, so each validates against the file the last one wrote
+    with open(f'{data_dir}/{LOCK_FILE}', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def read_journal(data_dir=DATA_DIR):
+    try:
+        with open(f'{data_dir}/{JOURNAL}') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def appended_since(name, digest, data_dir=DATA_DIR):
+    """(Year, Month) keys ingested into `name` since it had `digest`, or None
+    when the current file isn't reachable from that digest through appends
+    alone (it was edited by hand) and whatever was built from it must be
+    rebuilt."""
+    current = file_digest(f'{data_dir}/{name}')
+    keys = []
+    for entry in read_journal(data_dir):
+        if entry['file'] == name and entry['before'] == digest:
+            keys.extend(entry['keys'])
+            digest = entry['after']
+    return [tuple(key) for key in keys] if digest == current else None
+
+
+@timer('ingest.append')
+def append(source, rows, data_dir=DATA_DIR):
+    """Validates `rows` and appends them to the source csv ('palm_oil' or
+    'climate'), journals the new months and refreshes the data store.
+    Returns the rows as written."""
+    name, columns = SOURCES[source]
+    path = f'{data_dir}/{name}'
+    with _ingesting(data_dir):
+        existing = pd.read_csv(path)
+        rows = validate(rows, existing, columns)
+        if 'Date' in existing.columns:
+            # the climate files date each month on its 16th
+            rows.insert(2, 'Date', [f'{y}-{m:02d}-16' for y, m in zip(rows['Year'], rows['Month'])])
+        rows = rows.reindex(columns=existing.columns)
+
+        keys = pd.MultiIndex.from_frame(rows[KEY_COLUMNS])
+        placeholders = pd.MultiIndex.from_frame(existing[KEY_COLUMNS]).isin(keys)
+        if placeholders.any():
+            write = _rewrite_csv(pd.concat([existing[~placeholders], rows], ignore_index=True).sort_values(KEY_COLUMNS))
+        else:
+            write = _append_csv(path, rows)
+
+        def journal(tmp):
+            # journaled before the new file replaces the old one: after a crash in between, the
+            # current file isn't reachable through the journal and appended_since asks for a rebuild
+            entry = {'file': name, 'before': file_digest(path), 'after': file_digest(tmp), 'keys': rows[KEY_COLUMNS].values.tolist()}
+            with open(f'{data_dir}/{JOURNAL}', 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+        atomic_write(path, write, mode='w', before_replace=journal)
+    # only the arrays of the file that changed are rewritten
+    open_store(data_dir)
+    return rows
+
+
+def ingest_palm_oil(rows, data_dir=DATA_DIR):
+    # monthly MPOB figures: Year, Month, FFB_Yield, FFB_production, CPO_Yield
+    return append('palm_oil', rows, data_dir)
+
+
+def ingest_climate(rows, data_dir=DATA_DIR):
+    # observed monthly climate with the historical file's raw columns
+    return append('climate', rows, data_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append new monthly MPOB yield or climate rows to the app data.')
+    parser.add_argument('source', choices=list(SOURCES), help='palm_oil for MPOB yields, climate for observed climate')
+    parser.add_argument('input', help='csv file of the new months')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='directory of the data CSVs (default: %(default)s)')
+    args = parser.parse_args()
+
+    try:
+        rows = append(args.source, pd.read_csv(args.input), args.data_dir)
+    except ValueError as e:
+        sys.exit(f'error: {e}')
+    (y0, m0), (y1, m1) = rows[KEY_COLUMNS].iloc[[0, -1]].values.tolist()
+    print(f'Appended {len(rows)} months ({y0}-{m0:02d} to {y1}-{m1:02d}) to {SOURCES[args.source][0]}')
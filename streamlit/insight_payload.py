@@ -0,0 +1,138 @@
+import json
+import math
+
+import numpy as np
+
+from dashboard_data import CATEGORY_COLUMNS, MONTH_NAMES, YIELD_COLUMNS
+
+YIELD_LABELS = dict(zip(YIELD_COLUMNS, ['FFB Yield', 'CPO Yield', 'FFB Production']))
+# suffixes of the YieldIndex.metrics keys
+METRIC_KEYS = dict(zip(YIELD_COLUMNS, ['ffb', 'cpo', 'prod']))
+# how each climate variable is summarised over a year
+CLIMATE_AGGREGATES = {
+    'pr': ('Precipitation', 'sum'),
+    'tas': ('Temperature', 'mean'),
+    'hurs': ('Humidity', 'mean'),
+    'tasmax': ('Max Temperature', 'mean'),
+    'tasmin': ('Min Temperature', 'mean'),
+    'cwd': ('Consecutive Wet Days', 'max'),
+    'cdd': ('Consecutive Dry Days', 'max'),
+    'sd': ('Summer Days', 'sum'),
+}
+SIGNIFICANT_DIGITS = 4
+DEFAULT_TOKEN_BUDGET = 1200
+
+
+def _round(value):
+    value = float(value)
+    return None if math.isnan(value) else float(f'{value:.{SIGNIFICANT_DIGITS}g}')
+
+
+def _rounded(values):
+    return [_round(value) for value in values]
+
+
+def dumps(obj):
+    # sorted keys and no whitespace: the same dashboard state always gives the same bytes
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), allow_nan=False)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for JSON with BPE tokenizers
+    return math.ceil(len(text) / 4)
+
+
+def key_metrics(metrics):
+    out = {'year': metrics['latest_year'], 'previous_year': metrics['prev_year']}
+    for column, label in YIELD_LABELS.items():
+        key = METRIC_KEYS[column]
+        out[label] = {
+            'latest': _round(metrics[f'latest_{key}']),
+            'previous': _round(metrics[f'prev_{key}']),
+            'change_pct': _round(metrics[f'{key}_change_pct']),
+            'monthly_max': _round(metrics[f'highest_monthly_{key}']),
+            'monthly_mean': _round(metrics[f'avg_monthly_{key}']),
+        }
+    return out
+
+
+def trends(yearly_yield):
+    # yearly totals and the latest year against the mean of the window
+    out = {'years': yearly_yield['Year'].astype(int).tolist()}
+    for column, label in YIELD_LABELS.items():
+        values = yearly_yield[column].to_numpy(dtype=float)
+        baseline = np.nanmean(values)
+        out[label] = {
+            'yearly': _rounded(values),
+            'baseline': _round(baseline),
+            'latest_vs_baseline_pct': _round((values[-1] - baseline) / baseline * 100),
+        }
+    return out
+
+
+def monthly(this_year):
+    # the selected year's months, with the months that stood out by category
+    months = [MONTH_NAMES[m - 1] for m in this_year['Month']]
+    out = {'months': months}
+    for (column, label), category in zip(YIELD_LABELS.items(), CATEGORY_COLUMNS):
+        categories = this_year[category].astype(str).tolist()
+        out[label] = {
+            'values': _rounded(this_year[column]),
+            'peak': [m for m, c in zip(months, categories) if c == 'Peak Harvest'],
+            'below_average': [m for m, c in zip(months, categories) if c == 'Below Average'],
+        }
+    return out
+
+
+def climate(climate_info):
+    # yearly aggregate per variable, its anomaly against the period mean, and a monthly profile
+    grouped = climate_info.groupby('Year')
+    out = {'years': sorted(int(year) for year in grouped.groups)}
+    for column, (label, how) in CLIMATE_AGGREGATES.items():
+        yearly = grouped[column].agg(how).to_numpy(dtype=float)
+        baseline = yearly.mean()
+        out[label] = {
+            'aggregate': how,
+            'yearly': _rounded(yearly),
+            'baseline': _round(baseline),
+            'anomaly': _rounded(yearly - baseline),
+            'monthly_mean': _rounded(climate_info.groupby('Month')[column].mean()),
+        }
+    return out
+
+
+def _drop(section, field):
+    for value in section.values():
+        if isinstance(value, dict):
+            value.pop(field, None)
+
+
+# applied in order until the payload fits the budget, least informative first
+REDUCTIONS = [
+    lambda p: _drop(p['climate'], 'monthly_mean'),
+    lambda p: _drop(p['climate'], 'yearly'),
+    lambda p: _drop(p['monthly'], 'values'),
+    lambda p: _drop(p['trends'], 'yearly'),
+]
+
+
+def build_payload(metrics, yearly_yield, this_year, climate_info, max_tokens=DEFAULT_TOKEN_BUDGET):
+    """Compact, deterministic JSON for the AI insight table, one string per
+    input column. Detail is dropped step by step until the estimated token
+    count fits max_tokens; ValueError if even the smallest form does not."""
+    sections = {
+        'key_metrics': key_metrics(metrics),
+        'trends': trends(yearly_yield),
+        'monthly': monthly(this_year),
+        'climate': climate(climate_info),
+    }
+    reductions = iter(REDUCTIONS)
+    while True:
+        payload = {name: dumps(section) for name, section in sections.items()}
+        tokens = sum(estimate_tokens(text) for text in payload.values())
+        if tokens <= max_tokens:
+            return payload
+        reduce = next(reductions, None)
+        if reduce is None:
+            raise ValueError(f'Insight payload needs ~{tokens} tokens, over the budget of {max_tokens}')
+        reduce(sections)
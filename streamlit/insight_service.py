@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+from jamaibase import JamAI, protocol as p # type: ignore
+
+from instrumentation import observe
+
+# 'jamai' calls the JamAI action table, 'stub' generates summaries offline
+INSIGHT_BACKEND = os.environ.get('DASHBOARD_INSIGHT_BACKEND', 'jamai')
+TABLE_ID = 'AI_insights1'
+OUTPUT_COLUMN = 'Insight'
+
+
+def payload_key(data):
+    # stable hash of the dashboard payload, independent of key order
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class JamAIBackend:
+    """Streams the Insight column of the JamAI action table. A single client,
+    and with it one HTTP connection pool, serves every request."""
+
+    def __init__(self, project_id, pat, table_id=TABLE_ID, column=OUTPUT_COLUMN):
+        self.client = JamAI(project_id, pat)
+        self.table_id = table_id
+        self.column = column
+
+    def stream(self, data):
+        response = self.client.table.add_table_rows(
+            table_type=p.TableType.action,
+            request=p.RowAddRequest(table_id=self.table_id, data=[data], stream=True),
+        )
+        for chunk in response:
+            # the first item is the row's references, then one chunk per token and column
+            if isinstance(chunk, p.GenTableStreamChatCompletionChunk) and chunk.output_column_name == self.column:
+                yield chunk.text
+
+
+class StubBackend:
+    """Offline stand-in for JamAI: a canned summary of the payload, streamed
+    word by word after a fixed latency."""
+
+    def __init__(self, latency=0.5, delay=0.02):
+        self.latency = latency
+        self.delay = delay
+        self.calls = 0
+
+    def stream(self, data):
+        self.calls += 1
+        time.sleep(self.latency)
+        text = f"Offline summary {payload_key(data)[:8]}. Key metrics: {data.get('key_metrics', '')}"
+        for word in text.split(' '):
+            yield word + ' '
+            time.sleep(self.delay)
+
+
+class _Job:
+    # tokens of one in-flight request, shared by every session waiting on it
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+
+
+class InsightService:
+    """AI summaries generated on a worker pool, cached per payload hash for
+    `ttl` seconds. Identical requests that arrive while one is running follow
+    that request's token stream instead of starting their own."""
+
+    def __init__(self, backend, ttl=3600, maxsize=256, workers=4):
+        self.backend = backend
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='insight')
+
+    def _run(self, key, data, job):
+        start = time.perf_counter()
+        try:
+            for token in self.backend.stream(data):
+                if not job.tokens:
+                    observe('insight.first_token', time.perf_counter() - start)
+                with job.cond:
+                    job.tokens.append(token)
+                    job.cond.notify_all()
+        except Exception as exc:
+            job.error = exc
+        observe('insight.generate', time.perf_counter() - start)
+        with self._lock:
+            del self._inflight[key]
+            # failures are not cached, the next click retries
+            if job.error is None:
+                self._cache[key] = (time.monotonic() + self.ttl, ''.join(job.tokens))
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        with job.cond:
+            job.done = True
+            job.cond.notify_all()
+
+    def _job(self, data):
+        # cached text, or the in-flight job for this payload (started if needed)
+        key = payload_key(data)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return entry[1], None
+            if key in self._inflight:
+                self.joined += 1
+                return None, self._inflight[key]
+            self.misses += 1
+            job = self._inflight[key] = _Job()
+        self._pool.submit(self._run, key, data, job)
+        return None, job
+
+    def stream(self, data):
+        # tokens as they arrive; the request keeps running if the caller stops reading
+        text, job = self._job(data)
+        if job is None:
+            yield text
+            return
+        seen = 0
+        while True:
+            with job.cond:
+                while len(job.tokens) == seen and not job.done:
+                    job.cond.wait()
+                tokens = job.tokens[seen:]
+                done = job.done
+            seen += len(tokens)
+            yield from tokens
+            if done:
+                break
+        if job.error is not None:
+            raise job.error
+
+    def generate(self, data):
+        return ''.join(self.stream(data))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._cache),
+                'in_flight': len(self._inflight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'joined': self.joined,
+            }
+
+
+@st.cache_resource
+def get_insight_service():
+    # one service per process, shared by all sessions
+    if INSIGHT_BACKEND == 'stub':
+        return InsightService(StubBackend())
+    secrets = st.secrets['jamAIbase']
+    return InsightService(JamAIBackend(secrets['project_id'], secrets['pat']))
@@ -0,0 +1,191 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import ContextDecorator, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import numpy as np
+
+try:
+    from pyinstrument import Profiler  # type: ignore
+except ImportError:
+    Profiler = None
+
+# upper bounds in seconds, as in a Prometheus histogram
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_NAME = 'palm_yield_stage_seconds'
+# 'cprofile' or 'pyinstrument' profiles every rerun; otherwise only sessions that opt in
+PROFILE_RERUNS = os.environ.get('PROFILE_RERUNS', '')
+METRICS_PORT = os.environ.get('METRICS_PORT')
+# loopback unless a scraper on another host needs it, e.g. METRICS_HOST=0.0.0.0
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+
+
+class Histogram:
+    """Bucketed durations of one stage plus a window of recent samples for
+    percentiles. Observing is a bisect and a few increments under a lock."""
+
+    def __init__(self, buckets=BUCKETS, window=2048):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+
+    def summary(self):
+        with self._lock:
+            recent = np.array(self.recent)
+            count, total = self.count, self.sum
+        out = {'count': count, 'mean_ms': total / count * 1000 if count else 0.0}
+        for p in (50, 95, 99):
+            out[f'p{p}_ms'] = float(np.percentile(recent, p)) * 1000 if len(recent) else 0.0
+        out['max_ms'] = float(recent.max()) * 1000 if len(recent) else 0.0
+        return out
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+def histogram(stage):
+    with _lock:
+        if stage not in _histograms:
+            _histograms[stage] = Histogram()
+        return _histograms[stage]
+
+
+def observe(stage, seconds):
+    histogram(stage).observe(seconds)
+
+
+class timer(ContextDecorator):
+    """Time a block or a function into the stage's histogram:
+
+        with timer('process_data'): ...
+
+        @timer('build_dataset')
+        def build_dataset(): ...
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._starts = threading.local()
+
+    def __enter__(self):
+        self._starts.__dict__.setdefault('stack', []).append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self._starts.stack.pop())
+        return False
+
+
+def summary():
+    with _lock:
+        stages = dict(_histograms)
+    return {stage: stages[stage].summary() for stage in sorted(stages)}
+
+
+def prometheus_text():
+    # text exposition format, one histogram family labelled by stage
+    lines = [f'# HELP {METRIC_NAME} Time spent per app stage.', f'# TYPE {METRIC_NAME} histogram']
+    with _lock:
+        stages = dict(_histograms)
+    for stage in sorted(stages):
+        h = stages[stage]
+        with h._lock:
+            counts, count, total = list(h.counts), h.count, h.sum
+        cumulative = 0
+        for bound, n in zip(list(h.buckets) + ['+Inf'], counts):
+            cumulative += n
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {total}')
+        lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+# latest captured profiles, newest last
+profiles = deque(maxlen=20)
+
+
+@contextmanager
+def profile(name, mode='cprofile'):
+    # profile one block and keep the report in `profiles`
+    if mode == 'pyinstrument' and Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            profiles.append((name, time.time(), profiler.output_text(unicode=False, color=False)))
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+        profiles.append((name, time.time(), out.getvalue()))
+
+
+@contextmanager
+def rerun(page, session_state=None):
+    # times a whole page run; profiles it when enabled globally or by the session
+    mode = PROFILE_RERUNS or (session_state or {}).get('profile_reruns')
+    with timer(f'rerun.{page}'):
+        if mode:
+            with profile(page, mode):
+                yield
+        else:
+            yield
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if urlsplit(self.path).path != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    # plain-HTTP /metrics for a Prometheus scraper, once per process; off unless a port is set
+    global _server
+    with _lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+    return _server
@@ -0,0 +1,221 @@
+import argparse
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+
+import joblib  # type: ignore
+import sklearn
+
+from features import FEATURES
+from instrumentation import timer
+from model_registry import BUNDLE_ESTIMATOR, BUNDLE_HEADER, file_digest, read_header
+from tree_backend import FOREST_DIR, CompiledForest
+
+BUNDLE_DIR = 'streamlit/models'
+# bump when the files written by pack change
+FORMAT_VERSION = 2
+# every packed version lives here; a bundle path is a symlink to one of them
+VERSIONS_DIR = '.versions'
+# the eight columns the version 2 models were trained on
+MODEL2_FEATURES = ['Month', 'pr', 'rolling_pr_3y', 'tas', 'tasmin', 'tasmax', 'tas_range', 'hurs']
+# the months both palm_oil.csv and the historical climate cover
+TRAINING_RANGE = {'start': '1987-01', 'end': '2014-12'}
+
+# what training reported for each shipped pickle, copied into its bundle's header;
+# threshold is the historical monthly average a prediction is compared with
+MODEL_CARDS = {
+    'ffb_yield_model5': {
+        'target': 'FFB_Yield', 'features': FEATURES, 'threshold': 1.38, 'training_range': TRAINING_RANGE,
+        'metrics': {'R²': 0.706, 'MAE': 0.106, 'MSE': 0.018, 'RMSE': 0.131},
+    },
+    'cpo_yield_model5': {
+        'target': 'CPO_Yield', 'features': FEATURES, 'threshold': 0.27, 'training_range': TRAINING_RANGE,
+        'metrics': {'R²': 0.668, 'MAE': 0.025, 'MSE': 0.001, 'RMSE': 0.031},
+    },
+    'ffb_yield_model2': {
+        'target': 'FFB_Yield', 'features': MODEL2_FEATURES, 'threshold': 1.40, 'training_range': TRAINING_RANGE,
+        'metrics': {'R²': 0.70, 'MAE': 0.10},
+    },
+    'cpo_yield_model2': {
+        'target': 'CPO_Yield', 'features': MODEL2_FEATURES, 'threshold': 0.3, 'training_range': TRAINING_RANGE,
+        'metrics': {'R²': 0.69, 'MAE': 0.10},
+    },
+}
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path.rstrip('/')))[0]
+
+
+def bundle_path(source, bundle_dir=BUNDLE_DIR):
+    # streamlit/ffb_yield_model5.pkl -> streamlit/models/ffb_yield_model5
+    return f'{bundle_dir}/{_stem(source)}'
+
+
+def _sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def card_digest(card):
+    # a bundle's header copies its card, so the card's hash is part of what makes it current
+    return hashlib.sha256(json.dumps(card, sort_keys=True).encode()).hexdigest()
+
+
+def _publish(path, version):
+    # point the bundle's symlink at `version` with one rename, so a reader sees the old
+    # bundle or the new one, never a mix or nothing
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)  # unversioned bundle of an older format
+    link = f'{os.path.dirname(path)}/.{os.path.basename(path)}.link{os.getpid()}'
+    os.symlink(os.path.relpath(version, os.path.dirname(path)), link)
+    os.replace(link, path)
+    # the version just replaced stays for readers that resolved the link before the swap
+    keep = {os.path.realpath(version), previous}
+    for old in glob.glob(f'{os.path.dirname(version)}/{os.path.basename(path)}@*'):
+        if os.path.realpath(old) not in keep:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+@contextmanager
+def _packing(source, bundle_dir):
+    # one process packs a given bundle at a time
+    os.makedirs(bundle_dir, exist_ok=True)
+    with open(f'{bundle_dir}/.{_stem(source)}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def pack(source, bundle_dir=BUNDLE_DIR, card=None):
+    """Writes the bundle of a pickled model: the estimator as an uncompressed
+    joblib file (its arrays memory-map on load), the forest flattened into
+    .npy node arrays, and header.json with the schema, training range,
+    metrics, threshold and the sha256 of every file. The bundle is written
+    to a new version directory and then published by swapping the bundle
+    path's symlink. Returns the header."""
+    with _packing(source, bundle_dir):
+        return _pack(source, bundle_dir, card)
+
+
+@timer('model.pack')
+def _pack(source, bundle_dir, card=None):
+    # pack() without the lock, for callers that hold it
+    name = _stem(source)
+    card = card or MODEL_CARDS.get(name, {})
+    model = joblib.load(source)
+    features = [str(f) for f in getattr(model, 'feature_names_in_', [])]
+    if card.get('features') is not None and list(card['features']) != features:
+        raise ValueError(f'{source} was trained on {features}, its card lists {list(card["features"])}')
+
+    versions = f'{bundle_dir}/{VERSIONS_DIR}'
+    os.makedirs(versions, exist_ok=True)
+    tmp = f'{versions}/.{name}.tmp{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    joblib.dump(model, f'{tmp}/{BUNDLE_ESTIMATOR}')
+    try:
+        CompiledForest(model).save(f'{tmp}/{FOREST_DIR}')
+    except TypeError:
+        pass  # not a forest the compiled backend handles; the estimator alone is enough
+
+    files = {
+        os.path.relpath(f, tmp): _sha256(f)
+        for f in sorted(glob.glob(f'{tmp}/**/*', recursive=True)) if os.path.isfile(f)
+    }
+    match = re.fullmatch(r'(.+)_model(\d+)', name)
+    header = {
+        'format': FORMAT_VERSION,
+        'name': match.group(1) if match else name,
+        'version': int(match.group(2)) if match else None,
+        'target': card.get('target'),
+        'features': features,
+        'training_range': card.get('training_range'),
+        'metrics': card.get('metrics', {}),
+        'threshold': card.get('threshold'),
+        'estimator': type(getattr(model, 'best_estimator_', model)).__name__,
+        'sklearn_version': sklearn.__version__,
+        # file_digest of the bundle, the key of everything computed from its predictions
+        'source': {'path': source, 'sha256': file_digest(source)},
+        'files': files,
+        'card_sha256': card_digest(card),
+        # over the card too, so a card edit publishes a new version even if the files are unchanged
+        'content_hash': hashlib.sha256(json.dumps([files, card_digest(card)], sort_keys=True).encode()).hexdigest(),
+        'packed_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    with open(f'{tmp}/{BUNDLE_HEADER}', 'w') as f:
+        json.dump(header, f, indent=2, ensure_ascii=False)
+
+    version = f'{versions}/{name}@{header["content_hash"][:12]}'
+    try:
+        os.rename(tmp, version)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # the same content is already packed
+    _publish(bundle_path(source, bundle_dir), version)
+    return header
+
+
+def is_stale(source, path, card=None):
+    # out of date with the pickle, the bundle format, or the card in MODEL_CARDS
+    card = card or MODEL_CARDS.get(_stem(source), {})
+    try:
+        header = read_header(path)
+    except (OSError, ValueError):
+        return True
+    return (header.get('format') != FORMAT_VERSION or header['source']['sha256'] != file_digest(source)
+            or header.get('card_sha256') != card_digest(card))
+
+
+def ensure_bundle(source, bundle_dir=BUNDLE_DIR):
+    # the bundle path for a pickle, packed on first use or when the pickle changed, by one
+    # process at a time; a bundle deployed without its pickle is used as is
+    path = bundle_path(source, bundle_dir)
+    if os.path.exists(source) and is_stale(source, path):
+        with _packing(source, bundle_dir):
+            # packed by another process while this one waited
+            if is_stale(source, path):
+                _pack(source, bundle_dir)
+    return path
+
+
+def list_bundles(bundle_dir=BUNDLE_DIR, name=None):
+    # every bundle's header, by name then version; only the small JSON files are read
+    headers = []
+    for header in glob.glob(f'{bundle_dir}/*/{BUNDLE_HEADER}'):
+        path = os.path.dirname(header)
+        entry = {**read_header(path), 'path': path}
+        if name is None or entry['name'] == name:
+            headers.append(entry)
+    return sorted(headers, key=lambda h: (h['name'], h['version'] or 0))
+
+
+def latest(name, bundle_dir=BUNDLE_DIR, features=None):
+    # path of the newest bundle of `name`, optionally the newest trained on `features`
+    matches = [h for h in list_bundles(bundle_dir, name) if features is None or h['features'] == list(features)]
+    if not matches:
+        raise LookupError(f'No {name} bundle in {bundle_dir}' + (' for these features' if features else ''))
+    return matches[-1]['path']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack pickled models into bundles, or list the bundles.')
+    parser.add_argument('pickles', nargs='*', help='pickled models to pack (default: list the bundles)')
+    parser.add_argument('--bundle-dir', default=BUNDLE_DIR, help='where bundles live (default: %(default)s)')
+    args = parser.parse_args()
+
+    for source in args.pickles:
+        header = pack(source, args.bundle_dir)
+        print(f"Packed {source} into {bundle_path(source, args.bundle_dir)} ({header['content_hash'][:12]})")
+    if not args.pickles:
+        for header in list_bundles(args.bundle_dir):
+            print(f"{header['name']} v{header['version']}  {header['target']}  {len(header['features'])} features  "
+                  f"R² {header['metrics'].get('R²')}  {header['content_hash'][:12]}  {header['path']}")
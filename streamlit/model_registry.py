@@ -0,0 +1,133 @@
+import fnmatch
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import joblib  # type: ignore
+
+from instrumentation import timer
+
+# older artifacts still referenced by modeltest.py, evicted before anything else
+RETIRED_PATTERNS = ['*_model2', '*_model2.pkl']
+# a model bundle is a directory: this JSON header plus the estimator (see model_bundle.py)
+BUNDLE_HEADER = 'header.json'
+BUNDLE_ESTIMATOR = 'estimator.joblib'
+
+_digests = {}
+_headers = {}
+
+
+def file_digest(path):
+    # sha256 of a file, memoised on (size, mtime) so reruns only pay for a stat; a bundle
+    # is identified by the pickle it was packed from, so repacking it changes no cache key
+    if os.path.isdir(path):
+        return read_header(path)['source']['sha256']
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digests:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        _digests[key] = sha.hexdigest()
+    return _digests[key]
+
+
+def read_header(path):
+    # a bundle's JSON header, memoised like file_digest; nothing is unpickled
+    header = os.path.realpath(f'{path}/{BUNDLE_HEADER}')
+    stat = os.stat(header)
+    key = (header, stat.st_size, stat.st_mtime_ns)
+    if key not in _headers:
+        with open(header) as f:
+            _headers[key] = json.load(f)
+    return _headers[key]
+
+
+def check_features(path, features):
+    # fail before loading anything when a bundle was trained on other columns
+    expected = read_header(path)['features']
+    if list(features) != expected:
+        raise ValueError(f"{os.path.basename(path)} expects the features {expected}, got {list(features)}")
+
+
+def resolve(path):
+    # the version directory a published bundle points at; read a bundle's files through
+    # this, so a repack swapping the link in between can't mix two versions
+    return os.path.realpath(path) if os.path.isdir(path) else path
+
+
+def _load(path, mmap_mode):
+    # a plain pickle, or a bundle's estimator once its digest matches the header
+    if not os.path.isdir(path):
+        return joblib.load(path, mmap_mode=mmap_mode)
+    estimator = f'{path}/{BUNDLE_ESTIMATOR}'
+    if file_digest(estimator) != read_header(path)['files'][BUNDLE_ESTIMATOR]:
+        raise ValueError(f'{path} does not match its header, repack it')
+    return joblib.load(estimator, mmap_mode=mmap_mode)
+
+
+class ModelRegistry:
+    """Loads each model artifact (a pickle or a bundle directory) once per
+    process, keyed by (path, sha256)."""
+
+    def __init__(self, max_models=4, mmap_mode='r', retired=RETIRED_PATTERNS):
+        self.max_models = max_models
+        self.mmap_mode = mmap_mode
+        self.retired = list(retired)
+        self.loads = 0
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_retired(self, path):
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.retired)
+
+    def get(self, path):
+        real = resolve(path)
+        key = (os.path.abspath(path), file_digest(real))
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+            # a new hash for a known path means the artifact was redeployed
+            for old in [k for k in self._models if k[0] == key[0]]:
+                del self._models[old]
+
+            with timer('load.model'):
+                model = _load(real, self.mmap_mode)
+            self.loads += 1
+            self._models[key] = model
+            self._evict()
+            return model
+
+    def _evict(self):
+        while len(self._models) > self.max_models:
+            retired = [k for k in self._models if self.is_retired(k[0])]
+            # retired versions go first, otherwise least recently used
+            victim = retired[0] if retired else next(iter(self._models))
+            del self._models[victim]
+
+    def retire(self, pattern):
+        with self._lock:
+            self.retired.append(pattern)
+            for key in [k for k in self._models if self.is_retired(k[0])]:
+                del self._models[key]
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._models)
+
+
+registry = ModelRegistry()
+
+
+def load_model(path):
+    return registry.get(path)
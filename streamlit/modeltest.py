@@ -1,15 +1,18 @@
-import joblib
 import pandas as pd
 import streamlit as st
+from climate_dataset import load_climate_dataset
+from inference_service import load_models
+from model_bundle import MODEL2_FEATURES, ensure_bundle
+from model_registry import read_header
 
 @st.cache_data
 def load_data(path):
     data = pd.read_csv(path)
     return data
 
-def load_model(path):
-    model = joblib.load(path)
-    return model
+@st.cache_resource
+def load_climate():
+    return load_climate_dataset()
 
 def page2():
     print('\n\n')
@@ -17,8 +20,11 @@ def page2():
     st.title('Yield Prediction Tool 🔨')
     
     # Load the prediction models
-    ffb_model = load_model('streamlit/ffb_yield_model2.pkl')
-    cpo_model = load_model('streamlit/cpo_yield_model2.pkl') 
+    ffb_path = ensure_bundle('streamlit/ffb_yield_model2.pkl')
+    cpo_path = ensure_bundle('streamlit/cpo_yield_model2.pkl')
+    # these take the 8 version 2 columns, not the 15 features PredictionTool builds
+    models = load_models({'FFB_Yield': ffb_path, 'CPO_Yield': cpo_path}, features=MODEL2_FEATURES)
+    ffb_model, cpo_model = models['FFB_Yield'], models['CPO_Yield']
      
     cols = st.columns((2.5, 7), gap='medium')
     
@@ -59,9 +65,9 @@ def page2():
                 
             with cols[1]:
                 st.subheader('Predicted Yield')
-                ffb_input_df = pd.DataFrame([[month, pr, pr_3y, tas, tasmin, tasmax, tas_range, hurs]], columns=['Month','pr', 'rolling_pr_3y', 'tas', 'tasmin', 'tasmax', 'tas_range', 'hurs'])
+                ffb_input_df = pd.DataFrame([[month, pr, pr_3y, tas, tasmin, tasmax, tas_range, hurs]], columns=MODEL2_FEATURES)
                 ffb_pred = ffb_model.predict(ffb_input_df)[0]
-                threshold_ffb = 1.40
+                threshold_ffb = read_header(ffb_path)['threshold']
                 colour = 'green' if ffb_pred > threshold_ffb else 'red'
                 st.markdown(
                     f"""
@@ -74,9 +80,9 @@ def page2():
                 )   
                 st.divider()
                     
-                cpo_input_df = pd.DataFrame([[month, pr, pr_3y, tas, tasmin, tasmax, tas_range, hurs]], columns=['Month','pr', 'rolling_pr_3y', 'tas', 'tasmin', 'tasmax', 'tas_range', 'hurs'])
+                cpo_input_df = pd.DataFrame([[month, pr, pr_3y, tas, tasmin, tasmax, tas_range, hurs]], columns=MODEL2_FEATURES)
                 cpo_pred = cpo_model.predict(cpo_input_df)[0]
-                threshold_cpo = 0.3
+                threshold_cpo = read_header(cpo_path)['threshold']
                 colour = 'green' if cpo_pred > threshold_cpo else 'red'
                 
                 
@@ -101,9 +107,9 @@ def page2():
                 selected_month = st.slider('Select Month', min_value=1, max_value=12, value=1, step=1)
                 
                 # fetch SSP data 
-                ssp_df = pd.read_csv(f'streamlit/data/{selected_ssp}_climate3.csv')
-                ssp_input = ssp_df[(ssp_df['Year'] == selected_years) & (ssp_df['Month'] == selected_month)]
-                ssp_input = ssp_input[['Month','pr', 'rolling_pr_3y', 'tas', 'tasmin', 'tasmax', 'tas_range', 'hurs']]
+                # indexed lookup of one month, in the columns the model was trained on
+                ssp_input = load_climate().features(selected_ssp, selected_years, selected_month)
+                ssp_input = ssp_input[MODEL2_FEATURES]
                 st.write(f'Pojected Climate Data for {selected_month}, {selected_years}: ')
                 st.write('Precipitation:', ssp_input['pr'].values[0])
                 st.write('Temperature:', ssp_input['tas'].values[0])
@@ -112,7 +118,7 @@ def page2():
                 with cols[1]:
                     st.subheader('Predicted Yield')
                     ffb_pred = ffb_model.predict(ssp_input)[0]
-                    threshold_ffb = 1.40
+                    threshold_ffb = read_header(ffb_path)['threshold']
                     colour = 'green' if ffb_pred > threshold_ffb else 'red'
                     st.markdown(
                         f"""
@@ -126,7 +132,7 @@ def page2():
                     st.divider()
                         
                     cpo_pred = cpo_model.predict(ssp_input)[0]
-                    threshold_cpo = 0.3
+                    threshold_cpo = read_header(cpo_path)['threshold']
                     colour = 'green' if cpo_pred > threshold_cpo else 'red'
                     
                     
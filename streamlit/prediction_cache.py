@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURES
+from instrumentation import timer
+from inference_service import load_models
+from model_registry import file_digest
+from projection import MODEL_PATHS
+
+
+class PredictionCache:
+    """LRU cache of FFB/CPO predictions keyed on the quantized feature vector
+    and the model file hashes. One instance is shared by every session."""
+
+    def __init__(self, maxsize=4096, decimals=2):
+        self.maxsize = maxsize
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def quantize(self, features):
+        return np.round(np.asarray(features, dtype=float), self.decimals)
+
+    def predict(self, features, model_paths=MODEL_PATHS):
+        # predictions are made on the quantized row so a cached value is exact for its key
+        row = self.quantize(features)
+        version = tuple(file_digest(path) for path in model_paths.values())
+        key = (version, row.tobytes())
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        # both models read the same one-row frame
+        X = pd.DataFrame(row.reshape(1, -1), columns=FEATURES)
+        with timer('model.predict'):
+            models = load_models(model_paths)
+            result = {target: float(models[target].predict(X)[0]) for target in model_paths}
+
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+manual_cache = PredictionCache()
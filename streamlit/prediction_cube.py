@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from data_store import atomic_save, atomic_write_json
+from instrumentation import timer
+from model_registry import file_digest
+from projection import FEATURES, MODEL_PATHS, SSP_SCENARIOS, TARGETS, Projection, build_projection, ensure_models, load_models, load_scenarios
+
+DATA_DIR = 'streamlit/data'
+CUBE_DIR = 'streamlit/data/cube'
+# bump when the files written by build_cube change
+CUBE_VERSION = 4
+
+
+def input_paths(data_dir=DATA_DIR, model_paths=MODEL_PATHS):
+    paths = [f'{data_dir}/{ssp.lower()}_climate4.csv' for ssp in SSP_SCENARIOS]
+    return paths + list(model_paths.values())
+
+
+def input_hashes(data_dir=DATA_DIR, model_paths=MODEL_PATHS):
+    return {path: file_digest(path) for path in input_paths(data_dir, model_paths)}
+
+
+def read_manifest(cube_dir=CUBE_DIR):
+    try:
+        with open(f'{cube_dir}/manifest.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(cube_dir=CUBE_DIR, data_dir=DATA_DIR, model_paths=MODEL_PATHS):
+    ensure_models()  # the bundles' digests are inputs
+    manifest = read_manifest(cube_dir)
+    return manifest is None or manifest.get('version') != CUBE_VERSION or manifest['inputs'] != input_hashes(data_dir, model_paths)
+
+
+def build_cube(cube_dir=CUBE_DIR, data_dir=DATA_DIR, model_paths=MODEL_PATHS):
+    # in-process models on the configured backend; the bands need every tree's output
+    projection = build_projection(load_models(model_paths), load_scenarios(data_dir))
+
+    os.makedirs(cube_dir, exist_ok=True)
+    # replaced, not overwritten: other server processes may have the old arrays mapped
+    atomic_save(f'{cube_dir}/predictions.npy', projection.predictions)
+    atomic_save(f'{cube_dir}/climate.npy', projection.climate)
+    atomic_save(f'{cube_dir}/bands.npy', projection.bands)
+    manifest = {
+        'version': CUBE_VERSION,
+        'inputs': input_hashes(data_dir, model_paths),
+        'scenarios': projection.scenarios,
+        'targets': TARGETS,
+        'features': FEATURES,
+        'start_year': projection.start_year,
+        'quantiles': projection.quantiles,
+        'shape': list(projection.predictions.shape),
+    }
+    # written last so a half-built cube is never picked up as fresh
+    atomic_write_json(f'{cube_dir}/manifest.json', manifest)
+    return manifest
+
+
+@timer('load.prediction_cube')
+def load_cube(cube_dir=CUBE_DIR, data_dir=DATA_DIR, model_paths=MODEL_PATHS):
+    # rebuild only when a model or SSP csv hash changed, then memory-map the arrays
+    if is_stale(cube_dir, data_dir, model_paths):
+        build_cube(cube_dir, data_dir, model_paths)
+    manifest = read_manifest(cube_dir)
+    predictions = np.load(f'{cube_dir}/predictions.npy', mmap_mode='r')
+    climate = np.load(f'{cube_dir}/climate.npy', mmap_mode='r')
+    bands = np.load(f'{cube_dir}/bands.npy', mmap_mode='r')
+    return Projection(climate, predictions, manifest['scenarios'], manifest['start_year'], bands, manifest['quantiles'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the SSP prediction cube.')
+    parser.add_argument('--force', action='store_true', help='rebuild even if the inputs are unchanged')
+    args = parser.parse_args()
+
+    if args.force or is_stale():
+        manifest = build_cube()
+        print(f"Built prediction cube {manifest['shape']} in {CUBE_DIR}")
+    else:
+        print('Prediction cube is up to date')
@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from climate_dataset import load_climate_dataset
+from features import FEATURES
+from instrumentation import timer
+from model_bundle import bundle_path, ensure_bundle
+from model_registry import check_features, load_model
+from tree_backend import predict_with_intervals, sized_model
+
+SSP_SCENARIOS = ['SSP126', 'SSP245', 'SSP370', 'SSP585']
+TARGETS = ['FFB_Yield', 'CPO_Yield']
+MODEL_SOURCES = {
+    'FFB_Yield': 'streamlit/ffb_yield_model5.pkl',
+    'CPO_Yield': 'streamlit/cpo_yield_model5.pkl',
+}
+# the bundles the app loads; ensure_models() packs them from the pickles
+MODEL_PATHS = {target: bundle_path(source) for target, source in MODEL_SOURCES.items()}
+START_YEAR = 2015
+END_YEAR = 2100
+# spread of the individual trees shown as the prediction band
+QUANTILES = (0.1, 0.9)
+# 'sklearn' or 'compiled' (flattened numpy trees for batches up to COMPILED_MAX_ROWS,
+# sklearn above it; see tree_backend.py)
+INFERENCE_BACKEND = os.environ.get('YIELD_INFERENCE_BACKEND', 'sklearn')
+
+
+def ensure_models(model_sources=MODEL_SOURCES):
+    # packs a bundle that's missing or older than its pickle; after the first call in a
+    # process this is a stat of each pickle and header
+    return {target: ensure_bundle(source) for target, source in model_sources.items()}
+
+
+def load_models(model_paths=MODEL_PATHS, backend=None, features=FEATURES):
+    ensure_models()
+    # a bundle trained on other columns fails here, before anything is unpickled
+    for path in model_paths.values():
+        if os.path.isdir(path):
+            check_features(path, features)
+    if (backend or INFERENCE_BACKEND) == 'compiled':
+        return {target: sized_model(path) for target, path in model_paths.items()}
+    return {target: load_model(path) for target, path in model_paths.items()}
+
+
+def load_scenarios(data_dir='streamlit/data'):
+    # views of the normalized climate dataset, one schema for every scenario
+    dataset = load_climate_dataset(data_dir, SSP_SCENARIOS)
+    return {ssp: dataset.scenario_frame(ssp) for ssp in SSP_SCENARIOS}
+
+
+class Projection:
+    """Whole-horizon climate and yield projections held as
+    (scenario x year x month x column) arrays so lookups are plain indexing."""
+
+    def __init__(self, climate, predictions, scenarios=SSP_SCENARIOS, start_year=START_YEAR, bands=None, quantiles=QUANTILES):
+        self.climate = climate
+        self.predictions = predictions
+        # (scenario x year x month x target x quantile), None when not computed
+        self.bands = bands
+        self.quantiles = list(quantiles)
+        self.scenarios = list(scenarios)
+        self.start_year = start_year
+        self.years = np.arange(start_year, start_year + predictions.shape[1])
+
+    def _index(self, ssp, year, month):
+        return self.scenarios.index(ssp), year - self.start_year, month - 1
+
+    def climate_row(self, ssp, year, month):
+        s, y, m = self._index(ssp, year, month)
+        return pd.Series(self.climate[s, y, m], index=FEATURES)
+
+    def climate_year(self, ssp, year):
+        # the twelve feature rows of one scenario year
+        s, y, _ = self._index(ssp, year, 1)
+        return pd.DataFrame(self.climate[s, y], columns=FEATURES)
+
+    def predict(self, ssp, year, month):
+        s, y, m = self._index(ssp, year, month)
+        return dict(zip(TARGETS, self.predictions[s, y, m]))
+
+    def interval(self, ssp, year, month):
+        s, y, m = self._index(ssp, year, month)
+        return {target: tuple(self.bands[s, y, m, t]) for t, target in enumerate(TARGETS)}
+
+    def yearly(self, ssp, target):
+        # yearly means of the monthly prediction and its band, for charts
+        s, t = self.scenarios.index(ssp), TARGETS.index(target)
+        frame = pd.DataFrame({'Year': self.years, 'Prediction': np.nanmean(self.predictions[s, :, :, t], axis=1)})
+        if self.bands is not None:
+            frame['Lower'] = np.nanmean(self.bands[s, :, :, t, 0], axis=1)
+            frame['Upper'] = np.nanmean(self.bands[s, :, :, t, -1], axis=1)
+        return frame
+
+    def to_frame(self):
+        # tidy (scenario, year, month) frame of all predictions
+        s, y, m = np.meshgrid(np.arange(len(self.scenarios)), self.years, np.arange(1, 13), indexing='ij')
+        frame = pd.DataFrame({
+            'Scenario': np.asarray(self.scenarios)[s.ravel()],
+            'Year': y.ravel(),
+            'Month': m.ravel(),
+        })
+        for i, target in enumerate(TARGETS):
+            frame[target] = self.predictions[..., i].ravel()
+            if self.bands is not None:
+                for q, quantile in enumerate(self.quantiles):
+                    frame[f'{target}_p{round(quantile * 100)}'] = self.bands[..., i, q].ravel()
+        return frame.dropna(subset=TARGETS).reset_index(drop=True)
+
+
+def build_projection(models, scenarios, start_year=START_YEAR, end_year=END_YEAR, quantiles=QUANTILES):
+    # models: {target: estimator or CompiledForest}, scenarios: {ssp: climate frame}
+    names = list(scenarios)
+    n_years = end_year - start_year + 1
+    climate = np.full((len(names), n_years, 12, len(FEATURES)), np.nan)
+    predictions = np.full((len(names), n_years, 12, len(TARGETS)), np.nan)
+    bands = np.full(predictions.shape + (len(quantiles),), np.nan)
+
+    for s, ssp in enumerate(names):
+        df = scenarios[ssp]
+        df = df[(df['Year'] >= start_year) & (df['Year'] <= end_year)]
+        y = df['Year'].to_numpy() - start_year
+        m = df['Month'].to_numpy().astype(int) - 1
+        X = df[FEATURES]
+        climate[s, y, m] = X.to_numpy()
+        # one batched pass per model per scenario gives the prediction and its band
+        for t, target in enumerate(TARGETS):
+            with timer('model.predict_intervals'):
+                predictions[s, y, m, t], bands[s, y, m, t] = predict_with_intervals(models[target], X, quantiles)
+
+    return Projection(climate, predictions, names, start_year, bands, quantiles)
@@ -0,0 +1,76 @@
+import argparse
+import os
+
+import pandas as pd
+from joblib import Parallel, delayed  # type: ignore
+
+from climate_dataset import load_climate_dataset
+from data_store import open_store
+from model_registry import load_model
+from projection import MODEL_PATHS, SSP_SCENARIOS, ensure_models
+
+DATA_DIR = 'streamlit/data'
+
+
+def _score(scenario, target, path, data_dir):
+    # runs in a worker; the registry keeps one memory-mapped copy of each model per process
+    dataset = load_climate_dataset(data_dir, [scenario])
+    rows = dataset.rows(scenario)
+    return pd.DataFrame({
+        'Scenario': scenario,
+        'Year': dataset.year[rows],
+        'Month': dataset.month[rows],
+        'Target': target,
+        'Model': os.path.splitext(os.path.basename(path))[0],
+        'Prediction': load_model(path).predict(dataset.features(scenario)),
+    })
+
+
+def scenario_jobs(scenarios=SSP_SCENARIOS, model_paths=MODEL_PATHS):
+    # model_paths maps a target to one artifact or a list of ensemble members
+    for scenario in scenarios:
+        for target, paths in model_paths.items():
+            for path in [paths] if isinstance(paths, str) else paths:
+                yield scenario, target, path
+
+
+def run_scenarios(scenarios=SSP_SCENARIOS, model_paths=MODEL_PATHS, data_dir=DATA_DIR, n_jobs=-1):
+    # one job per scenario x model, fanned out over loky worker processes
+    open_store(data_dir)  # rebuilt here if needed, so the workers only map it
+    ensure_models()  # packed here, not by every worker
+    results = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_score)(scenario, target, path, data_dir)
+        for scenario, target, path in scenario_jobs(scenarios, model_paths)
+    )
+    return pd.concat(results, ignore_index=True)
+
+
+def projection_results(projection, model_paths=MODEL_PATHS):
+    # the prediction cube in run_scenarios' tidy layout, without scoring anything
+    frame = projection.to_frame()
+    return pd.concat([
+        frame[['Scenario', 'Year', 'Month']].assign(
+            Target=target, Model=os.path.splitext(os.path.basename(path))[0], Prediction=frame[target],
+        )
+        for target, path in model_paths.items()
+    ], ignore_index=True)
+
+
+def compare_scenarios(results, target, freq='Year'):
+    # yearly (or decadal) mean prediction per scenario, averaged over ensemble members
+    results = results[results['Target'] == target]
+    period = results['Year'] // 10 * 10 if freq == 'Decade' else results['Year']
+    return (results.assign(Period=period)
+            .groupby(['Scenario', 'Period'], as_index=False)['Prediction'].mean()
+            .rename(columns={'Period': freq}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score every SSP scenario with every yield model.')
+    parser.add_argument('output', help='csv file for the tidy scenario x model predictions')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    results = run_scenarios(n_jobs=args.n_jobs)
+    results.to_csv(args.output, index=False)
+    print(f'Wrote {len(results):,} predictions to {args.output}')
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from features import FEATURES, ROLLING_WINDOWS
+from instrumentation import timer
+from projection import TARGETS
+
+# raw variables a user can sweep; the derived features follow them
+SWEEP_VARIABLES = ['pr', 'prpercnt', 'hurs', 'spei12', 'tas', 'tasmin', 'tasmax', 'cdd', 'cwd', 'sd']
+LABELS = {
+    'pr': 'Precipitation (mm)', 'prpercnt': 'Precipitation (% of normal)', 'hurs': 'Humidity (%)',
+    'spei12': 'Drought index', 'tas': 'Temperature (°C)', 'tasmin': 'Minimum Temperature (°C)',
+    'tasmax': 'Maximum Temperature (°C)', 'cdd': 'Consecutive Dry Days', 'cwd': 'Consecutive Wet Days',
+    'sd': 'Summer Days',
+}
+DEFAULT_POINTS = 40
+
+
+def variable_ranges(climate, variables=SWEEP_VARIABLES):
+    # observed min and max of each variable, the default sweep bounds
+    return {v: (float(np.nanmin(climate[v])), float(np.nanmax(climate[v]))) for v in variables}
+
+
+def _base_rows(base):
+    # a feature row (Series or one-row frame) or several rows, as a 2-D float array
+    if isinstance(base, pd.Series):
+        return base[FEATURES].to_numpy(dtype=float)[None, :]
+    return base[FEATURES].to_numpy(dtype=float)
+
+
+def _set(X, variable, values):
+    # change one variable in place and keep tas_range and the rolling sums consistent
+    col = FEATURES.index(variable)
+    if variable == 'pr':
+        # this month is the last term of every trailing sum
+        delta = values - X[:, col]
+        for name in ROLLING_WINDOWS:
+            X[:, FEATURES.index(name)] += delta
+    X[:, col] = values
+    if variable in ('tasmin', 'tasmax'):
+        X[:, FEATURES.index('tas_range')] = X[:, FEATURES.index('tasmax')] - X[:, FEATURES.index('tasmin')]
+
+
+def _predict(models, X):
+    # one batched call per model over the whole grid
+    frame = pd.DataFrame(X, columns=FEATURES)
+    with timer('model.predict'):
+        return {target: models[target].predict(frame) for target in TARGETS}
+
+
+@timer('sensitivity.sweep')
+def sweep(models, base, variables, bounds, points=DEFAULT_POINTS):
+    """Predictions on a points x points grid (or a line for one variable)
+    around a single base row. bounds maps each variable to (low, high).
+    Returns one row per grid point: the swept variables and each target."""
+    if not 1 <= len(variables) <= 2 or len(set(variables)) != len(variables):
+        raise ValueError('Sweep one variable or two different variables')
+    axes = [np.linspace(*bounds[v], points) for v in variables]
+    grid = [axis.ravel() for axis in np.meshgrid(*axes, indexing='ij')]
+
+    X = np.repeat(_base_rows(base)[:1], len(grid[0]), axis=0)
+    for variable, values in zip(variables, grid):
+        _set(X, variable, values)
+
+    result = pd.DataFrame(dict(zip(variables, grid)))
+    for target, prediction in _predict(models, X).items():
+        result[target] = prediction
+    return result
+
+
+@timer('sensitivity.partial_dependence')
+def partial_dependence(models, background, variable, bounds, points=DEFAULT_POINTS):
+    """Partial dependence of each target on one variable: at every grid
+    value, the mean prediction over all background rows (e.g. the twelve
+    months of an SSP year), all scored in a single batch."""
+    rows = _base_rows(background)
+    values = np.linspace(*bounds[variable], points)
+    X = np.tile(rows, (points, 1))
+    _set(X, variable, np.repeat(values, len(rows)))
+
+    result = pd.DataFrame({variable: values})
+    for target, prediction in _predict(models, X).items():
+        result[target] = prediction.reshape(points, len(rows)).mean(axis=1)
+    return result
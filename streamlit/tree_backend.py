@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from model_registry import file_digest, load_model, resolve
+
+# where a model bundle keeps its flattened forest
+FOREST_DIR = 'forest'
+FOREST_ARRAYS = ['feature', 'threshold', 'left', 'right', 'value', 'roots', 'mean', 'scale']
+# above this many rows sklearn's per-tree loop is faster than the compiled forest
+# (about 0.4x its throughput at 100k rows, see benchmarks/tree_backend.py)
+COMPILED_MAX_ROWS = 1000
+
+
+def _unwrap(model):
+    # RandomizedSearchCV -> Pipeline(scaler, forest) -> forest
+    model = getattr(model, 'best_estimator_', model)
+    scaler = None
+    if hasattr(model, 'steps'):
+        *pre, (_, model) = model.steps
+        if len(pre) > 1 or (pre and not hasattr(pre[0][1], 'scale_')):
+            raise TypeError('Only a StandardScaler in front of the forest is supported')
+        scaler = pre[0][1] if pre else None
+    if hasattr(model, 'learning_rate'):
+        raise TypeError(f'{type(model).__name__} is a boosted ensemble; only averaging forests are supported')
+    trees = getattr(model, 'estimators_', None)
+    trees = [model] if trees is None else list(np.ravel(trees))
+    if not trees or not all(hasattr(tree, 'tree_') for tree in trees):
+        raise TypeError(f'{type(model).__name__} is not a tree ensemble')
+    if trees[0].tree_.n_outputs != 1:
+        raise TypeError('Only single-output regressors are supported')
+    return scaler, trees
+
+
+class CompiledForest:
+    """A regression forest flattened into numpy node arrays and evaluated for a
+    whole batch at once, one tree level per step.
+
+    Inputs are scaled in float64 and cast to float32 before the threshold
+    tests, and tree outputs are summed in estimator order, exactly as sklearn
+    does, so predictions are bit-identical to model.predict."""
+
+    def __init__(self, model):
+        self.feature_names = list(getattr(model, 'feature_names_in_', []))
+        scaler, trees = _unwrap(model)
+        self.mean = getattr(scaler, 'mean_', None) if scaler is not None and scaler.with_mean else None
+        self.scale = getattr(scaler, 'scale_', None) if scaler is not None and scaler.with_std else None
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            t = tree.tree_
+            nodes = np.arange(t.node_count)
+            leaf = t.children_left == -1
+            # leaves point at themselves so extra steps are no-ops
+            lefts.append(np.where(leaf, nodes, t.children_left) + offset)
+            rights.append(np.where(leaf, nodes, t.children_right) + offset)
+            features.append(np.where(leaf, 0, t.feature))
+            thresholds.append(np.where(leaf, np.inf, t.threshold))
+            values.append(t.value[:, 0, 0])
+            roots.append(offset)
+            offset += t.node_count
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.value = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.n_trees = len(trees)
+        self.depth = max(tree.tree_.max_depth for tree in trees)
+
+    def save(self, path):
+        # one .npy per node array, so a loaded forest can be memory-mapped instead of rebuilt
+        os.makedirs(path, exist_ok=True)
+        for name in FOREST_ARRAYS:
+            if getattr(self, name) is not None:
+                np.save(f'{path}/{name}.npy', getattr(self, name))
+        with open(f'{path}/forest.json', 'w') as f:
+            json.dump({'feature_names': self.feature_names, 'n_trees': self.n_trees, 'depth': self.depth}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        forest = cls.__new__(cls)
+        with open(f'{path}/forest.json') as f:
+            forest.__dict__.update(json.load(f))
+        for name in FOREST_ARRAYS:
+            exists = os.path.exists(f'{path}/{name}.npy')
+            setattr(forest, name, np.load(f'{path}/{name}.npy', mmap_mode=mmap_mode) if exists else None)
+        return forest
+
+    def _prepare(self, X):
+        if isinstance(X, pd.DataFrame) and self.feature_names:
+            X = X[self.feature_names]
+        X = np.array(X, dtype=np.float64, ndmin=2)
+        if self.mean is not None:
+            X -= self.mean
+        if self.scale is not None:
+            X /= self.scale
+        return X.astype(np.float32)
+
+    def tree_predictions(self, X, chunk_size=512):
+        # (n_trees, n_rows) matrix of every tree's output; small chunks keep the gathers in cache
+        X = self._prepare(X)
+        out = np.empty((self.n_trees, len(X)))
+        for start in range(0, len(X), chunk_size):
+            rows = X[start:start + chunk_size]
+            row_index = np.arange(len(rows))[None, :]
+            node = np.repeat(self.roots[:, None], len(rows), axis=1)
+            for _ in range(self.depth):
+                go_left = rows[row_index, self.feature[node]] <= self.threshold[node]
+                node = np.where(go_left, self.left[node], self.right[node])
+            out[:, start:start + len(rows)] = self.value[node]
+        return out
+
+    def predict(self, X):
+        # cumsum adds the trees one after another, like sklearn's accumulator
+        return np.cumsum(self.tree_predictions(X), axis=0)[-1] / self.n_trees
+
+
+class SizedForest:
+    """A compiled forest for small batches and the sklearn estimator, unpickled
+    on first use, for batches above `max_rows`, so one backend setting serves
+    both the single-row pages and the batch jobs at their best speed."""
+
+    def __init__(self, compiled, path, max_rows=COMPILED_MAX_ROWS):
+        self.compiled = compiled
+        self.path = path
+        self.max_rows = max_rows
+        self._estimator = None
+
+    @property
+    def estimator(self):
+        if self._estimator is None:
+            self._estimator = load_model(self.path)
+        return self._estimator
+
+    def backend(self, X):
+        return self.compiled if len(X) <= self.max_rows else self.estimator
+
+    def predict(self, X):
+        return self.backend(X).predict(X)
+
+
+def tree_predictions(model, X):
+    # (n_trees, n_rows) outputs of a compiled forest, or of a sklearn model's own trees
+    if isinstance(model, SizedForest):
+        model = model.backend(X)
+    if isinstance(model, CompiledForest):
+        return model.tree_predictions(X)
+    scaler, trees = _unwrap(model)
+    X = scaler.transform(X) if scaler is not None else np.asarray(X, dtype=np.float64)
+    return np.stack([tree.predict(X) for tree in trees])
+
+
+def predict_with_intervals(model, X, quantiles=(0.1, 0.9)):
+    # point prediction and per-row quantiles across the trees, on whichever backend `model` is
+    if isinstance(model, SizedForest):
+        model = model.backend(X)
+    trees = tree_predictions(model, X)
+    if isinstance(model, CompiledForest):
+        prediction = np.cumsum(trees, axis=0)[-1] / model.n_trees
+    else:
+        prediction = model.predict(X)
+    return prediction, np.quantile(trees, quantiles, axis=0).T
+
+
+_compiled = {}
+_lock = threading.Lock()
+
+
+def compiled_model(path):
+    # one compiled copy per artifact version, mapped from a bundle or built from the registry's estimator
+    real = resolve(path)
+    key = (path, file_digest(real))
+    with _lock:
+        if key not in _compiled:
+            forest = f'{real}/{FOREST_DIR}'
+            _compiled[key] = CompiledForest.load(forest) if os.path.isdir(forest) else CompiledForest(load_model(path))
+        return _compiled[key]
+
+
+def sized_model(path, max_rows=COMPILED_MAX_ROWS):
+    # the compiled forest below `max_rows`, the estimator from the registry above it
+    return SizedForest(compiled_model(path), path, max_rows)
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the app's modules are flat files in streamlit/ and resolve their data relative to the repository root
+sys.path.insert(0, os.path.join(ROOT, 'streamlit'))
+os.chdir(ROOT)
+
+FFB_PICKLE = 'streamlit/ffb_yield_model5.pkl'
+
+
+@pytest.fixture(scope='session')
+def ffb_model():
+    import joblib  # type: ignore
+
+    return joblib.load(FFB_PICKLE)
+
+
+@pytest.fixture(scope='session')
+def ffb_bundle(tmp_path_factory):
+    # a bundle of the shipped FFB model, packed away from streamlit/models
+    from model_bundle import bundle_path, pack
+
+    bundle_dir = str(tmp_path_factory.mktemp('models'))
+    pack(FFB_PICKLE, bundle_dir)
+    return bundle_path(FFB_PICKLE, bundle_dir)
+
+
+@pytest.fixture(scope='session')
+def ssp_rows():
+    # the 15 model features of every SSP585 month
+    from projection import FEATURES, load_scenarios
+
+    return load_scenarios()['SSP585'][FEATURES]
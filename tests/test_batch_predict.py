@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq  # type: ignore
+
+from batch_predict import predict_file
+from projection import FEATURES
+
+
+def test_parquet_output_spans_chunks_with_different_dtypes(ffb_model, ssp_rows, tmp_path):
+    # whole-number pr in the first chunk only: it reads as int64 there and float64 after
+    rows = ssp_rows.iloc[:20].reset_index(drop=True)
+    pr = rows['pr'].astype(object)
+    pr[:10] = rows['pr'][:10].round().astype(int)
+    rows.assign(pr=pr).to_csv(tmp_path / 'climate.csv', index=False)
+
+    models = {'FFB_Yield': ffb_model, 'CPO_Yield': ffb_model}
+    stats = predict_file(str(tmp_path / 'climate.csv'), str(tmp_path / 'out.parquet'), chunk_size=10, models=models)
+    assert stats['rows'] == 20
+
+    out = pq.read_table(tmp_path / 'out.parquet').to_pandas()
+    assert (out[FEATURES].dtypes == np.float64).all()
+    expected = ffb_model.predict(pd.read_csv(tmp_path / 'climate.csv')[FEATURES])
+    np.testing.assert_array_equal(out['FFB_Yield'], expected)
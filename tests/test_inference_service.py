@@ -0,0 +1,138 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import inference_service
+from inference_service import InferenceClient, InferenceServer, RemoteModel, check_address, check_socket_dir, load_models
+from model_registry import load_model
+
+
+@pytest.fixture
+def service(tmp_path, ffb_bundle):
+    # the service CLI in its own process, serving the FFB bundle on a unix socket
+    address = str(tmp_path / 'inference.sock')
+    server = subprocess.Popen(
+        [sys.executable, 'streamlit/inference_service.py', '--address', address, '--workers', '1', ffb_bundle],
+        stdout=subprocess.DEVNULL,
+    )
+    client = InferenceClient(address)
+    for _ in range(600):
+        try:
+            client.served()
+            break
+        except ConnectionError:
+            time.sleep(0.1)
+    else:
+        server.kill()
+        pytest.fail('the inference service did not start')
+    yield server, address
+    if server.poll() is None:
+        server.terminate()
+        server.wait()
+
+
+def test_remote_predictions_equal_local(service, ffb_bundle, ssp_rows):
+    _, address = service
+    model = load_models({'FFB_Yield': ffb_bundle}, address=address)['FFB_Yield']
+    assert isinstance(model, RemoteModel)
+    expected = load_model(ffb_bundle).predict(ssp_rows)
+    assert np.array_equal(model.predict(ssp_rows), expected)
+    # columns are put back in the header's order
+    assert np.array_equal(model.predict(ssp_rows[ssp_rows.columns[::-1]]), expected)
+
+
+def test_concurrent_requests_are_batched(service, ffb_bundle, ssp_rows):
+    _, address = service
+    model = load_models({'FFB_Yield': ffb_bundle}, address=address)['FFB_Yield']
+    expected = load_model(ffb_bundle).predict(ssp_rows)
+    results = {}
+
+    def session(i):
+        results[i] = [model.predict(ssp_rows.iloc[[j]])[0] for j in range(i, len(ssp_rows), 8)]
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i, values in results.items():
+        assert np.array_equal(values, expected[i::8])
+    stats = InferenceClient(address).stats()
+    assert stats['requests'] >= len(ssp_rows)
+
+
+def test_unserved_path_is_refused(service, ssp_rows):
+    _, address = service
+    with pytest.raises(ValueError, match='not served'):
+        InferenceClient(address).predict('streamlit/models/other', ssp_rows.to_numpy())
+
+
+def test_stopped_service_falls_back_to_local(service, ffb_bundle, ssp_rows):
+    server, address = service
+    model = load_models({'FFB_Yield': ffb_bundle}, address=address)['FFB_Yield']
+    expected = load_model(ffb_bundle).predict(ssp_rows)
+    assert np.array_equal(model.predict(ssp_rows), expected)
+
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=60)
+    assert not os.path.exists(address)
+    # the connection this thread had, then a reconnect to the removed socket
+    assert np.array_equal(model.predict(ssp_rows), expected)
+    assert np.array_equal(model.predict(ssp_rows), expected)
+    # a session thread that never connected
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(prediction=model.predict(ssp_rows)))
+    thread.start()
+    thread.join()
+    assert np.array_equal(result['prediction'], expected)
+    # and pages loading models afterwards get in-process ones
+    assert not isinstance(load_models({'FFB_Yield': ffb_bundle}, address=address)['FFB_Yield'], RemoteModel)
+
+
+def test_socket_is_private(service, ffb_bundle, monkeypatch):
+    _, address = service
+    assert os.stat(address).st_mode & 0o777 == 0o600
+    # a socket of another user's is never connected to; the pages predict in-process
+    uid = os.getuid()
+    monkeypatch.setattr(inference_service.os, 'getuid', lambda: uid + 1)
+    assert not isinstance(load_models({'FFB_Yield': ffb_bundle}, address=address)['FFB_Yield'], RemoteModel)
+
+
+def test_socket_dir_must_be_private(tmp_path):
+    check_socket_dir(str(tmp_path / 'run' / 'inference.sock'))
+    assert os.stat(tmp_path / 'run').st_mode & 0o777 == 0o700
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(ValueError, match='Other users'):
+        check_socket_dir(str(shared / 'inference.sock'))
+    shared.chmod(0o1777)
+    check_socket_dir(str(shared / 'inference.sock'))
+
+
+def test_no_service_loads_in_process(tmp_path, ffb_bundle):
+    models = load_models({'FFB_Yield': ffb_bundle}, address=str(tmp_path / 'missing.sock'))
+    assert not isinstance(models['FFB_Yield'], RemoteModel)
+
+
+def test_tcp_needs_an_authkey_and_loopback():
+    with pytest.raises(ValueError, match='YIELD_INFERENCE_AUTHKEY'):
+        check_address('127.0.0.1:7070', authkey=None)
+    with pytest.raises(ValueError, match='YIELD_INFERENCE_AUTHKEY'):
+        InferenceServer([], '127.0.0.1:7070', workers=1, authkey=None)
+    with pytest.raises(ValueError, match='loopback'):
+        check_address('0.0.0.0:7070', authkey=b'secret')
+    assert check_address(':7070', authkey=b'secret') == ('127.0.0.1', 7070)
+    assert check_address('0.0.0.0:7070', authkey=b'secret', allow_remote=True) == ('0.0.0.0', 7070)
+    assert check_address('/tmp/palm.sock', authkey=None) == '/tmp/palm.sock'
+
+
+def test_client_refuses_tcp_without_authkey():
+    with pytest.raises(ValueError):
+        InferenceClient('127.0.0.1:7070', authkey=None)
@@ -0,0 +1,156 @@
+import glob
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import climate_dataset
+import dashboard_data
+from data_store import PALM_OIL_COLUMNS, open_store
+from ingest import HISTORICAL_FILE, PALM_OIL_FILE, appended_since, ingest_climate, ingest_palm_oil, read_journal, validate
+
+
+def palm(months, year=2024, **values):
+    # MPOB rows for consecutive months of `year`
+    rows = pd.DataFrame({'Year': year, 'Month': months, 'FFB_Yield': 1.4, 'FFB_production': 8e6, 'CPO_Yield': 0.3})
+    return rows.assign(**values)
+
+
+@pytest.fixture
+def existing():
+    # filled to 2024-10, with 2024-11 and 2024-12 as empty placeholders like palm_oil.csv
+    frame = palm([8, 9, 10])
+    return pd.concat([frame, frame.iloc[:2].assign(Month=[11, 12], FFB_Yield=np.nan, FFB_production=np.nan, CPO_Yield=np.nan)])
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for path in glob.glob('streamlit/data/*.csv'):
+        shutil.copy(path, tmp_path)
+    return str(tmp_path)
+
+
+def test_valid_rows_are_returned_in_month_order(existing):
+    rows = validate(palm([12, 11]), existing, PALM_OIL_COLUMNS)
+    assert rows['Month'].tolist() == [11, 12]
+    assert rows['Year'].dtype == np.int64
+
+
+def test_next_year_continues_december(existing):
+    rows = pd.concat([palm([11, 12]), palm([1], year=2025)])
+    assert len(validate(rows, existing, PALM_OIL_COLUMNS)) == 3
+
+
+@pytest.mark.parametrize('rows, message', [
+    (palm([11]).drop(columns='CPO_Yield'), 'Missing columns: CPO_Yield'),
+    (palm([]), 'No rows'),
+    (palm([11, 12], FFB_Yield=['x', 1.2]), 'Non-numeric or empty values in rows \\[1\\]'),
+    (palm([11, 12], CPO_Yield=[0.3, np.nan]), 'Non-numeric or empty values in rows \\[2\\]'),
+    (palm([11, 13]), 'between 1 and 12'),
+    (palm([11.5]), 'whole numbers'),
+    (palm([11, 11]), 'Duplicate months'),
+    (pd.concat([palm([11]), palm([1], year=2025)]), 'skip a month'),
+    (palm([10, 11]), '2024-10 is already in the data'),
+    (palm([12]), 'start at the month after 2024-10'),
+])
+def test_invalid_rows(existing, rows, message):
+    with pytest.raises(ValueError, match=message):
+        validate(rows, existing, PALM_OIL_COLUMNS)
+
+
+def test_palm_oil_fills_placeholders_and_is_journaled(data_dir):
+    before = open_store(data_dir).palm_oil()
+    original = pd.read_csv(f'{data_dir}/{PALM_OIL_FILE}')
+    ingest_palm_oil(pd.concat([palm([11, 12]), palm([1], year=2025)]), data_dir)
+
+    after = pd.read_csv(f'{data_dir}/{PALM_OIL_FILE}')
+    assert len(after) == len(original) + 1
+    assert after.tail(3)[['Year', 'Month']].values.tolist() == [[2024, 11], [2024, 12], [2025, 1]]
+    assert not after.tail(3).isna().any().any()
+    # the store is brought up to date
+    assert len(open_store(data_dir).palm_oil()) == len(before) + 1
+    entry, = read_journal(data_dir)
+    assert entry['keys'] == [[2024, 11], [2024, 12], [2025, 1]]
+    assert appended_since(PALM_OIL_FILE, entry['before'], data_dir) == [(2024, 11), (2024, 12), (2025, 1)]
+    assert appended_since(PALM_OIL_FILE, entry['after'], data_dir) == []
+
+
+def test_climate_rows_are_appended_with_a_date(data_dir):
+    history = pd.read_csv(f'{data_dir}/{HISTORICAL_FILE}')
+    rows = history.tail(2).drop(columns='Date').assign(Year=2015, Month=[1, 2])
+    ingest_climate(rows, data_dir)
+    after = pd.read_csv(f'{data_dir}/{HISTORICAL_FILE}')
+    assert len(after) == len(history) + 2
+    assert after['Date'].tail(2).tolist() == ['2015-01-16', '2015-02-16']
+
+
+def test_hand_edit_breaks_the_chain(data_dir):
+    ingest_palm_oil(palm([11]), data_dir)
+    entry, = read_journal(data_dir)
+    with open(f'{data_dir}/{PALM_OIL_FILE}', 'a') as f:
+        f.write('2024,12,1,1,1\n')
+    assert appended_since(PALM_OIL_FILE, entry['before'], data_dir) is None
+
+
+def test_rejected_rows_leave_the_file_alone(data_dir):
+    path = f'{data_dir}/{PALM_OIL_FILE}'
+    with open(path) as f:
+        content = f.read()
+    with pytest.raises(ValueError):
+        ingest_palm_oil(palm([10]), data_dir)
+    with open(path) as f:
+        assert f.read() == content
+    assert read_journal(data_dir) == []
+
+
+def test_concurrent_ingests_of_one_month(data_dir):
+    # the second validates against the file the first wrote, so it is rejected rather than lost
+    def ingest(_):
+        try:
+            return ingest_palm_oil(palm([11]), data_dir)
+        except ValueError:
+            return None
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(ingest, range(2)))
+    assert sum(rows is not None for rows in results) == 1
+    entry, = read_journal(data_dir)
+    assert appended_since(PALM_OIL_FILE, entry['before'], data_dir) == [(2024, 11)]
+
+
+def test_dashboard_refresh_matches_a_fresh_build(data_dir, monkeypatch):
+    dataset = dashboard_data.build_dataset(data_dir)
+    ingest_palm_oil(palm([11, 12]), data_dir)
+    ingest_palm_oil(palm([1, 2], year=2025), data_dir)
+
+    fresh = dashboard_data.build_dataset(data_dir)
+    # refresh must extend the index, not rebuild
+    monkeypatch.setattr(dashboard_data, 'build_dataset', None)
+    refreshed = dataset.refresh(data_dir)
+    assert refreshed.version == fresh.version
+    pd.testing.assert_frame_equal(refreshed.palm_oil, fresh.palm_oil)
+    pd.testing.assert_frame_equal(refreshed.climate_info, fresh.climate_info)
+    for name in ('years', 'totals', 'change_pct', 'monthly_max', 'monthly_mean'):
+        np.testing.assert_array_equal(getattr(refreshed.index, name), getattr(fresh.index, name))
+    pd.testing.assert_frame_equal(refreshed.index._yearly, fresh.index._yearly)
+    pd.testing.assert_frame_equal(refreshed.index._categories, fresh.index._categories)
+    for year in (2024, 2025):
+        pd.testing.assert_frame_equal(refreshed.index.this_year(year), fresh.index.this_year(year))
+
+
+def test_climate_refresh_matches_a_fresh_build(data_dir, monkeypatch):
+    scenarios = ['historical', 'SSP126']
+    dataset = climate_dataset._build(data_dir, scenarios)
+    history = pd.read_csv(f'{data_dir}/{HISTORICAL_FILE}')
+    ingest_climate(history.tail(3).drop(columns='Date').assign(Year=2015, Month=[1, 2, 3]), data_dir)
+
+    fresh = climate_dataset._build(data_dir, scenarios)
+    monkeypatch.setattr(climate_dataset, '_build', None)
+    refreshed = dataset.refresh(data_dir)
+    assert refreshed.version == fresh.version
+    assert refreshed.ranges == fresh.ranges
+    np.testing.assert_array_equal(refreshed.year, fresh.year)
+    np.testing.assert_array_equal(refreshed.month, fresh.month)
+    np.testing.assert_array_equal(refreshed.values, fresh.values)
@@ -0,0 +1,28 @@
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from instrumentation import _MetricsHandler, observe
+
+
+@pytest.fixture
+def metrics_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_metrics_path_only(metrics_url):
+    observe('test.scrape', 0.01)
+    with urllib.request.urlopen(f'{metrics_url}/metrics?x=1') as response:
+        assert response.status == 200
+        assert 'stage="test.scrape"' in response.read().decode()
+    for path in ('/', '/favicon.ico', '/metrics/x'):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'{metrics_url}{path}')
+        assert error.value.code == 404
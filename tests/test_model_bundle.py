@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+
+import model_bundle
+from model_bundle import FORMAT_VERSION, MODEL2_FEATURES, bundle_path, ensure_bundle, is_stale, latest, list_bundles, pack
+from model_registry import BUNDLE_ESTIMATOR, ModelRegistry, check_features, file_digest, read_header
+from projection import FEATURES
+from tree_backend import compiled_model
+
+PICKLE = 'streamlit/ffb_yield_model5.pkl'
+
+
+def test_header(tmp_path):
+    header = pack(PICKLE, str(tmp_path))
+    path = bundle_path(PICKLE, str(tmp_path))
+    assert read_header(path) == header
+    assert header['format'] == FORMAT_VERSION
+    assert (header['name'], header['version'], header['target']) == ('ffb_yield', 5, 'FFB_Yield')
+    assert header['features'] == FEATURES
+    assert header['metrics']['R²'] == 0.706
+    assert header['threshold'] == 1.38
+    assert header['source']['sha256'] == file_digest(PICKLE)
+    assert {BUNDLE_ESTIMATOR, 'forest/value.npy'} <= set(header['files'])
+
+
+def test_check_features(ffb_bundle):
+    check_features(ffb_bundle, FEATURES)
+    with pytest.raises(ValueError, match='expects the features'):
+        check_features(ffb_bundle, MODEL2_FEATURES)
+
+
+def test_bundle_predicts_like_the_pickle(ffb_bundle, ffb_model, ssp_rows):
+    expected = ffb_model.predict(ssp_rows)
+    assert np.array_equal(ModelRegistry().get(ffb_bundle).predict(ssp_rows), expected)
+    assert np.array_equal(compiled_model(ffb_bundle).predict(ssp_rows), expected)
+
+
+def test_repack_publishes_a_new_version_with_the_same_digest(tmp_path):
+    pack(PICKLE, str(tmp_path))
+    path = bundle_path(PICKLE, str(tmp_path))
+    first, digest = os.path.realpath(path), file_digest(path)
+    pack(PICKLE, str(tmp_path))
+    # a symlink swap, the previous version kept for readers that resolved it
+    assert os.path.islink(path) and os.path.realpath(path) != first
+    assert os.path.isdir(first)
+    assert file_digest(path) == digest
+    pack(PICKLE, str(tmp_path))
+    assert not os.path.exists(first)
+
+
+def test_tampered_estimator_is_refused(tmp_path):
+    pack(PICKLE, str(tmp_path))
+    path = bundle_path(PICKLE, str(tmp_path))
+    with open(f'{path}/{BUNDLE_ESTIMATOR}', 'ab') as f:
+        f.write(b'\0')
+    with pytest.raises(ValueError, match='does not match its header'):
+        ModelRegistry().get(path)
+
+
+def test_ensure_bundle_packs_only_when_stale(tmp_path, monkeypatch):
+    path = ensure_bundle(PICKLE, str(tmp_path))
+    assert not is_stale(PICKLE, path)
+    packed = []
+    monkeypatch.setattr(model_bundle, '_pack', lambda *args: packed.append(args))
+    assert ensure_bundle(PICKLE, str(tmp_path)) == path
+    assert packed == []
+
+
+def test_card_edit_repacks(tmp_path, monkeypatch):
+    path = ensure_bundle(PICKLE, str(tmp_path))
+    card = {**model_bundle.MODEL_CARDS['ffb_yield_model5'], 'threshold': 1.5}
+    monkeypatch.setitem(model_bundle.MODEL_CARDS, 'ffb_yield_model5', card)
+    assert is_stale(PICKLE, path)
+    ensure_bundle(PICKLE, str(tmp_path))
+    assert read_header(path)['threshold'] == 1.5
+    assert not is_stale(PICKLE, path)
+
+
+def test_card_must_match_the_model(tmp_path):
+    with pytest.raises(ValueError, match='its card lists'):
+        pack(PICKLE, str(tmp_path), card={'features': MODEL2_FEATURES})
+
+
+def test_listing(tmp_path):
+    pack(PICKLE, str(tmp_path))
+    assert [h['path'] for h in list_bundles(str(tmp_path))] == [bundle_path(PICKLE, str(tmp_path))]
+    assert latest('ffb_yield', str(tmp_path), FEATURES) == bundle_path(PICKLE, str(tmp_path))
+    with pytest.raises(LookupError):
+        latest('ffb_yield', str(tmp_path), MODEL2_FEATURES)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.linear_model import LinearRegression
+
+from tree_backend import CompiledForest, predict_with_intervals, sized_model
+
+PICKLE = 'streamlit/ffb_yield_model5.pkl'
+
+
+def test_predictions_are_bit_identical(ffb_model, ssp_rows):
+    assert np.array_equal(CompiledForest(ffb_model).predict(ssp_rows), ffb_model.predict(ssp_rows))
+
+
+def test_out_of_range_rows(ffb_model, ssp_rows):
+    # rows far outside the training data still follow sklearn's threshold tests
+    rng = np.random.default_rng(0)
+    low, high = ssp_rows.min().to_numpy(), ssp_rows.max().to_numpy()
+    rows = ssp_rows.iloc[:0].reindex(range(500))
+    rows[:] = rng.uniform(low - (high - low), high + (high - low), size=rows.shape)
+    assert np.array_equal(CompiledForest(ffb_model).predict(rows), ffb_model.predict(rows))
+
+
+def test_single_row_and_chunks(ffb_model, ssp_rows):
+    forest = CompiledForest(ffb_model)
+    assert np.array_equal(forest.predict(ssp_rows.iloc[[5]]), ffb_model.predict(ssp_rows.iloc[[5]]))
+    trees = forest.tree_predictions(ssp_rows, chunk_size=7)
+    assert trees.shape == (forest.n_trees, len(ssp_rows))
+    assert np.array_equal(trees, forest.tree_predictions(ssp_rows))
+
+
+def test_saved_forest_maps_back(ffb_model, ssp_rows, tmp_path):
+    CompiledForest(ffb_model).save(str(tmp_path / 'forest'))
+    forest = CompiledForest.load(str(tmp_path / 'forest'))
+    assert isinstance(forest.value, np.memmap)
+    assert np.array_equal(forest.predict(ssp_rows), ffb_model.predict(ssp_rows))
+
+
+def test_intervals_match_across_backends(ffb_model, ssp_rows):
+    sklearn_prediction, sklearn_bands = predict_with_intervals(ffb_model, ssp_rows)
+    compiled_prediction, compiled_bands = predict_with_intervals(CompiledForest(ffb_model), ssp_rows)
+    assert np.array_equal(sklearn_prediction, ffb_model.predict(ssp_rows))
+    assert np.array_equal(compiled_prediction, sklearn_prediction)
+    assert np.array_equal(compiled_bands, sklearn_bands)
+    assert (sklearn_bands[:, 0] <= sklearn_bands[:, 1]).all()
+
+
+def test_rejects_models_that_are_not_forests(ssp_rows):
+    with pytest.raises(TypeError):
+        CompiledForest(LinearRegression().fit(ssp_rows, np.arange(len(ssp_rows))))
+
+
+def test_rejects_boosted_ensembles(ssp_rows):
+    # a boosted model's estimators_ is a 2-d array of trees whose outputs aren't averaged
+    boosted = GradientBoostingRegressor(n_estimators=3).fit(ssp_rows, np.arange(len(ssp_rows)))
+    with pytest.raises(TypeError):
+        CompiledForest(boosted)
+
+
+def test_sized_model_dispatches_on_batch_size(ffb_model, ssp_rows):
+    model = sized_model(PICKLE, max_rows=100)
+    assert model.backend(ssp_rows.iloc[:100]) is model.compiled
+    assert model._estimator is None
+    assert model.backend(ssp_rows.iloc[:101]) is model.estimator
+    for rows in (ssp_rows.iloc[:100], ssp_rows):
+        assert np.array_equal(model.predict(rows), ffb_model.predict(rows))
+        assert np.array_equal(predict_with_intervals(model, rows)[1], predict_with_intervals(ffb_model, rows)[1])